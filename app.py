@@ -1,18 +1,22 @@
 import streamlit as st
-from mail_utils import initialize_mails, send_email, parse_email_date, get_gmail_categories, fetch_all_categorized_emails
+from mail_utils import initialize_mails, send_email, parse_email_date, get_gmail_categories, fetch_all_categorized_emails, load_email_body, merge_categorized_emails, search_mailbox, merge_search_results
+from date_utils import annotate_email_dates, email_timestamp, to_display_time
 from gpt_utils import summarize_emails, generate_reply
 from auth_utils import login_form, logout, is_authenticated
 from database_utils import (
     save_email_to_supabase, 
     get_user_emails_from_supabase,
-    get_user_emails_by_category,
-    get_category_statistics,
+    get_user_emails_page,
+    get_user_emails_pages,
+    get_mailbox_statistics,
+    search_emails,
+    HIGHLIGHT_START,
+    HIGHLIGHT_END,
     save_email_summary,
     get_email_summary,
     save_email_reply,
     get_user_preferences,
     save_user_preference,
-    get_user_statistics,
     mark_email_as_processed
 )
 from datetime import datetime, date, timezone
@@ -323,6 +327,20 @@ if 'selected_email' not in st.session_state:
     st.session_state.selected_email = None
 if 'active_category' not in st.session_state:
     st.session_state.active_category = 'Boîte de réception'
+if 'unified_pages' not in st.session_state:
+    st.session_state.unified_pages = 1
+    st.session_state.unified_requests = []
+    st.session_state.unified_key = None
+if 'page_cursors' not in st.session_state:
+    st.session_state.page_cursors = [None]
+    st.session_state.page_cursors_key = None
+
+# Boîte unifiée : toutes les catégories fusionnées par date, affichées par pages
+ALL_CATEGORIES = "📥 Toutes les catégories"
+UNIFIED_PAGE_SIZE = 25
+
+# Taille d'une page de la liste d'une catégorie (pagination par curseur)
+EMAIL_PAGE_SIZE = 50
 
 # Header moderne
 st.markdown(f"""
@@ -343,7 +361,7 @@ with st.sidebar:
     st.markdown("---")
     
     # Sélection de catégorie
-    categories = list(get_gmail_categories().keys())
+    categories = [ALL_CATEGORIES] + list(get_gmail_categories().keys())
     selected_category = st.selectbox(
         "📂 Catégorie",
         categories,
@@ -353,6 +371,7 @@ with st.sidebar:
     if selected_category != st.session_state.active_category:
         st.session_state.active_category = selected_category
         st.session_state.current_view = 'list'
+        st.session_state.unified_pages = 1
         st.rerun()
     
     # Filtre par date
@@ -364,6 +383,9 @@ with st.sidebar:
         value=date.fromisoformat(default_date) if default_date else date.today()
     )
     
+    # Recherche plein texte dans les emails stockés
+    search_query = st.text_input("🔎 Rechercher", placeholder="Sujet, expéditeur, contenu...").strip()
+    
     # Options
     use_cache = st.checkbox("🗄️ Utiliser le cache", value=True)
     
@@ -375,64 +397,212 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("### 📊 Statistiques")
     
-    stats = get_user_statistics(user_id)
-    category_stats = get_category_statistics(user_id)
+    # Une seule requête d'agrégation pour toute la barre latérale
+    stats = get_mailbox_statistics(user_id)
+    category_stats = stats["categories"]
     
     st.metric("📧 Total emails", stats["total_emails"])
     st.metric("📋 Résumés", stats["summaries_generated"])
     st.metric("📤 Réponses", stats["replies_sent"])
-    st.metric(f"📂 {selected_category}", category_stats.get(selected_category, 0))
+    if selected_category == ALL_CATEGORIES:
+        st.metric(f"📂 {selected_category}", sum(category_stats.values()))
+    else:
+        st.metric(f"📂 {selected_category}", category_stats.get(selected_category, 0))
+
+def db_email_to_display(mail, category):
+    """Convertit une ligne user_emails en dictionnaire email pour l'affichage"""
+    return {
+        'db_id': mail.get('id'),
+        'email_id': mail.get('email_id'),
+        'subject': mail.get('subject', ''),
+        'from': mail.get('sender', ''),
+        'to': mail.get('recipient', ''),
+        'body': mail.get('snippet') or '',
+        'snippet': mail.get('snippet') or '',
+        'body_loaded': False,
+        'date': mail.get('date_received', ''),
+        'category': mail.get('category', category),
+        'is_processed': mail.get('is_processed', False)
+    }
+
+def highlight_to_html(highlight):
+    """Extrait de recherche échappé pour l'HTML, termes trouvés surlignés"""
+    return clean_html_text(highlight).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
 
 # Fonction pour charger les emails
+@st.cache_data(ttl=60)  # Cache 1 minute
+def search_emails_cached(user_id, query, category, since_date_str):
+    """Recherche dans les emails stockés, résultats classés par pertinence"""
+    results = search_emails(user_id, query, category, date.fromisoformat(since_date_str))
+    emails = []
+    for mail in results:
+        email_data = db_email_to_display(mail, mail.get('category'))
+        email_data['highlight'] = mail.get('highlight')
+        emails.append(email_data)
+    return annotate_email_dates(emails)
+
+def search_all_emails(user_id, query, category, since_date_str):
+    """Fédère la recherche locale et la recherche Gmail (messages non synchronisés)"""
+    local_emails = search_emails_cached(user_id, query, category, since_date_str)
+    
+    # Pas de st.cache_data ici : search_mailbox a son propre cache, par compte Gmail
+    category_folder = get_gmail_categories().get(category) if category else None
+    server_emails = search_mailbox(query, category_folder, date.fromisoformat(since_date_str))
+    for email_data in server_emails:
+        if category:
+            email_data['category'] = category
+    return merge_search_results(local_emails, server_emails)
+
+@st.cache_data(ttl=300)  # Cache 5 minutes
+def load_email_page_cached(user_id, category, since_date_str, cursor):
+    """Charge une page d'emails stockés d'une catégorie à partir d'un curseur (date_received, id)"""
+    emails, next_cursor = get_user_emails_page(
+        user_id,
+        category,
+        date.fromisoformat(since_date_str),
+        page_size=EMAIL_PAGE_SIZE,
+        cursor=cursor
+    )
+    return annotate_email_dates([db_email_to_display(mail, category) for mail in emails]), next_cursor
+
 @st.cache_data(ttl=300)  # Cache 5 minutes
-def load_emails_cached(category, since_date_str, use_cache_param):
-    """Charge les emails avec cache"""
+def load_emails_cached(user_id, category, since_date_str):
+    """Charge les emails d'une catégorie depuis Gmail avec cache"""
     try:
         since_date_obj = date.fromisoformat(since_date_str)
         
-        if use_cache_param:
-            # Charger depuis Supabase
-            cached_emails = get_user_emails_by_category(
-                user_id, 
-                since_date_obj, 
-                [category], 
-                limit_per_category=100
-            )
-            
-            if cached_emails and cached_emails.get(category):
-                emails = []
-                for mail in cached_emails[category]:
-                    emails.append({
-                        'db_id': mail.get('id'),
-                        'subject': mail.get('subject', ''),
-                        'from': mail.get('sender', ''),
-                        'to': mail.get('recipient', ''),
-                        'body': mail.get('body', ''),
-                        'date': mail.get('date_received', ''),
-                        'category': mail.get('category', category),
-                        'is_processed': mail.get('is_processed', False)
-                    })
-                return emails
-        
-        # Charger depuis Gmail
-        categorized_mails = fetch_all_categorized_emails(since_date_obj, limit_per_category=50)
+        # Charger depuis Gmail (en-têtes seuls, le corps est chargé à l'ouverture)
+        categorized_mails = fetch_all_categorized_emails(since_date_obj, limit_per_category=50, headers_only=True, single_pass=True)
         return categorized_mails.get(category, [])
         
     except Exception as e:
         st.error(f"Erreur lors du chargement : {str(e)}")
         return []
 
+@st.cache_data(ttl=300)  # Cache 5 minutes
+def load_category_pages_cached(user_id, since_date_str, use_cache_param, source, cursors):
+    """Charge la page suivante de chaque catégorie demandée, à partir de son curseur
+    
+    cursors : ((catégorie, curseur), ...), curseur None pour la première page. source vaut None au
+    premier chargement (Supabase si le cache est actif, sinon Gmail), puis la source de ce chargement.
+    Renvoie (source, {catégorie: (emails, curseur suivant ou None)}).
+    """
+    try:
+        since_date_obj = date.fromisoformat(since_date_str)
+        cursors = dict(cursors)
+        
+        if source == 'supabase' or (source is None and use_cache_param):
+            # Curseur (date_received, id) par catégorie ; premières pages en un seul appel
+            pages = get_user_emails_pages(user_id, cursors, since_date_obj, page_size=UNIFIED_PAGE_SIZE)
+            if source == 'supabase' or any(emails for emails, _ in pages.values()):
+                return 'supabase', {
+                    category: (annotate_email_dates([db_email_to_display(mail, category) for mail in emails]), next_cursor)
+                    for category, (emails, next_cursor) in pages.items()
+                }
+        
+        # Charger depuis Gmail (en-têtes seuls) ; curseur : plus petit UID déjà chargé de la catégorie
+        gmail_categories = get_gmail_categories()
+        emails_by_category = fetch_all_categorized_emails(
+            since_date_obj,
+            limit_per_category=UNIFIED_PAGE_SIZE,
+            headers_only=True,
+            single_pass=True,
+            categories={category: gmail_categories[category] for category in cursors},
+            before_uids={category: cursor for category, cursor in cursors.items() if cursor}
+        )
+        pages = {}
+        for category in cursors:
+            emails = emails_by_category.get(category, [])
+            uids = [int(email['uid']) for email in emails if email.get('uid')]
+            pages[category] = (emails, min(uids) if uids and len(emails) >= UNIFIED_PAGE_SIZE else None)
+        return 'gmail', pages
+        
+    except Exception as e:
+        st.error(f"Erreur lors du chargement : {str(e)}")
+        return source, {}
+
+def categories_to_extend(emails_by_category, next_cursors, limit):
+    """Catégories dont la page suivante peut entrer dans les `limit` premiers emails fusionnés"""
+    merged = merge_categorized_emails(emails_by_category, limit)
+    boundary = email_timestamp(merged[-1]) if len(merged) >= limit else None
+    return [
+        category for category, cursor in next_cursors.items()
+        if cursor is not None and (
+            boundary is None
+            or not emails_by_category[category]
+            or email_timestamp(emails_by_category[category][-1]) > boundary
+        )
+    ]
+
 # Interface principale
 if st.session_state.current_view == 'list':
     # Vue liste des emails
     
     # Charger les emails
+    has_more_emails = False
     with st.spinner("📧 Chargement des emails..."):
-        current_emails = load_emails_cached(
-            st.session_state.active_category,
-            since_date.isoformat(),
-            use_cache
-        )
+        if search_query:
+            search_category = None if st.session_state.active_category == ALL_CATEGORIES else st.session_state.active_category
+            current_emails = search_all_emails(user_id, search_query, search_category, since_date.isoformat())
+        elif st.session_state.active_category == ALL_CATEGORIES:
+            # Pages déjà demandées par catégorie (chacune en cache), rejouées puis fusionnées
+            unified_key = (since_date.isoformat(), use_cache)
+            if st.session_state.unified_key != unified_key:
+                st.session_state.unified_key = unified_key
+                st.session_state.unified_requests = [(None, tuple((category, None) for category in get_gmail_categories()))]
+                st.session_state.unified_pages = 1
+            
+            unified_limit = UNIFIED_PAGE_SIZE * st.session_state.unified_pages
+            emails_by_category = {category: [] for category in get_gmail_categories()}
+            next_cursors = {}
+            source = None
+            request_index = 0
+            while True:
+                while request_index < len(st.session_state.unified_requests):
+                    requested_source, cursors = st.session_state.unified_requests[request_index]
+                    source, pages = load_category_pages_cached(user_id, since_date.isoformat(), use_cache, requested_source, cursors)
+                    for category, _ in cursors:
+                        # Catégorie absente (erreur de chargement) : ne plus lui demander de page
+                        emails, next_cursor = pages.get(category, ([], None))
+                        emails_by_category[category].extend(emails)
+                        next_cursors[category] = next_cursor
+                    request_index += 1
+                
+                # Seules les catégories épuisées avant la fin de la fenêtre chargent leur page suivante
+                extend = categories_to_extend(emails_by_category, next_cursors, unified_limit)
+                if not extend:
+                    break
+                st.session_state.unified_requests.append((source, tuple((category, next_cursors[category]) for category in extend)))
+            
+            merged_emails = merge_categorized_emails(emails_by_category, unified_limit + 1)
+            current_emails = merged_emails[:unified_limit]
+            has_more_emails = len(merged_emails) > unified_limit or any(cursor is not None for cursor in next_cursors.values())
+        else:
+            current_emails = []
+            if use_cache:
+                # Pages déjà demandées pour cette catégorie et cette date, chacune en cache
+                page_key = (st.session_state.active_category, since_date.isoformat())
+                if st.session_state.page_cursors_key != page_key:
+                    st.session_state.page_cursors_key = page_key
+                    st.session_state.page_cursors = [None]
+                
+                next_cursor = None
+                for cursor in st.session_state.page_cursors:
+                    page, next_cursor = load_email_page_cached(
+                        user_id,
+                        st.session_state.active_category,
+                        since_date.isoformat(),
+                        cursor
+                    )
+                    current_emails.extend(page)
+                has_more_emails = next_cursor is not None
+            
+            if not current_emails:
+                current_emails = load_emails_cached(
+                    user_id,
+                    st.session_state.active_category,
+                    since_date.isoformat()
+                )
     
     # Affichage des statistiques rapides
     total_emails = len(current_emails)
@@ -450,10 +620,15 @@ if st.session_state.current_view == 'list':
     
     st.markdown("---")
     
-    if not current_emails:
+    if search_query and not current_emails:
+        st.info(f"🔎 Aucun résultat pour « {search_query} » dans '{st.session_state.active_category}'")
+    elif not current_emails:
         st.info(f"📭 Aucun email trouvé dans '{st.session_state.active_category}' depuis le {since_date.strftime('%d %b %Y')}")
     else:
-        st.markdown(f"### 📨 Emails de '{st.session_state.active_category}' ({len(current_emails)} trouvés)")
+        if search_query:
+            st.markdown(f"### 🔎 Résultats pour « {clean_html_text(search_query)} » ({len(current_emails)} trouvés)")
+        else:
+            st.markdown(f"### 📨 Emails de '{st.session_state.active_category}' ({len(current_emails)} trouvés)")
         
         # Liste des emails avec design moderne
         for idx, email in enumerate(current_emails):
@@ -461,7 +636,7 @@ if st.session_state.current_view == 'list':
             
             # Formater la date
             try:
-                email_date = parse_email_date(email.get('date', ''))
+                email_date = to_display_time(email.get('date_parsed') or parse_email_date(email.get('date', '')))
                 if email_date.date() == date.today():
                     date_str = email_date.strftime('%H:%M')
                 else:
@@ -475,14 +650,14 @@ if st.session_state.current_view == 'list':
             status_text = "🔵 Non lu" if is_unread else "✅ Lu"
             
             # Snippet du contenu
-            snippet = email.get('body', '')[:150].replace('\n', ' ').replace('\r', ' ')
+            snippet = (email.get('snippet') or email.get('body', ''))[:150].replace('\n', ' ').replace('\r', ' ')
             if len(snippet) > 150:
                 snippet += "..."
             
             # Nettoyer les données pour l'affichage HTML
             sender_clean = clean_html_text(email.get('from', 'Expéditeur inconnu'))
             subject_clean = clean_html_text(email.get('subject', 'Pas de sujet'))
-            snippet_clean = clean_html_text(snippet)
+            snippet_clean = highlight_to_html(email['highlight']) if email.get('highlight') else clean_html_text(snippet)
             
             st.markdown(f"""
             <div class="email-card {card_class}">
@@ -497,10 +672,19 @@ if st.session_state.current_view == 'list':
             """, unsafe_allow_html=True)
             
             # Bouton pour ouvrir l'email
-            if st.button(f"📖 Ouvrir cet email", key=f"open_email_{idx}", use_container_width=True):
+            if st.button(f"📖 Ouvrir cet email", key=f"open_email_{idx}_{email.get('email_id')}", use_container_width=True):
                 st.session_state.selected_email = email
                 st.session_state.current_view = 'detail'
                 st.rerun()
+        
+        # Page suivante (boîte unifiée, ou curseur de la catégorie)
+        if has_more_emails:
+            if st.button("⬇️ Afficher plus", key="load_more_emails", use_container_width=True):
+                if st.session_state.active_category == ALL_CATEGORIES:
+                    st.session_state.unified_pages += 1
+                else:
+                    st.session_state.page_cursors.append(next_cursor)
+                st.rerun()
 
 elif st.session_state.current_view == 'detail':
     # Vue détail d'un email
@@ -508,6 +692,12 @@ elif st.session_state.current_view == 'detail':
     if st.session_state.selected_email:
         email = st.session_state.selected_email
         
+        # Charger le corps complet si l'email a été listé en mode en-têtes seuls
+        if not email.get('body_loaded', True):
+            with st.spinner("📥 Chargement du message..."):
+                email = load_email_body(email, user_id)
+                st.session_state.selected_email = email
+        
         # Bouton retour
         if st.button("← Retour à la liste", key="back_to_list"):
             st.session_state.current_view = 'list'
@@ -525,7 +715,7 @@ elif st.session_state.current_view == 'detail':
             st.markdown(f"**À:** {clean_html_text(email.get('to'))}")
             
             try:
-                email_date = parse_email_date(email.get('date', ''))
+                email_date = to_display_time(email.get('date_parsed') or parse_email_date(email.get('date', '')))
                 formatted_date = email_date.strftime('%d %b %Y à %H:%M')
             except:
                 formatted_date = 'Date inconnue'
@@ -564,7 +754,14 @@ elif st.session_state.current_view == 'detail':
         # Contenu de l'email
         with st.expander("📄 Contenu complet de l'email", expanded=False):
             st.text(email.get('body', 'Pas de contenu'))
-        
+
+        # Pièces jointes (métadonnées seules, le contenu n'est pas téléchargé)
+        if email.get('attachments'):
+            st.markdown("**📎 Pièces jointes :** " + ", ".join(
+                f"{clean_html_text(attachment['filename'])} ({attachment['size'] // 1024} Ko)"
+                for attachment in email['attachments']
+            ))
+
         # Section réponse
         st.markdown("""
         <div class="reply-section">
@@ -0,0 +1,325 @@
+import asyncio
+import re
+import ssl
+import threading
+from mail_utils import (
+    IMAP_SERVER,
+    IMAP_FETCH_BATCH_SIZE,
+    MESSAGE_CHUNK_SIZE,
+    sort_emails_by_date,
+    get_gmail_categories,
+    _compress_uid_set,
+    _email_from_fetch_record,
+    _fetch_items_for,
+    _merge_part_records,
+    _parse_fetch_response,
+    _quote_mailbox,
+    _snippet_fetch_items,
+    _snippet_part_requests,
+    _text_part_fetch_items,
+    _text_part_requests,
+)
+from imap_pool import MAX_CONNECTIONS_PER_USER
+from mail_stream import StreamingMessageParser
+
+IMAP_SSL_PORT = 993
+
+# Délai maximal d'attente d'une réponse du serveur
+ASYNC_IMAP_TIMEOUT = 30
+
+# Longueur maximale d'une ligne de réponse (64 Kio par défaut dans asyncio) :
+# un "* SEARCH" sur un gros dossier dépasse largement cette limite (environ 8 octets par UID)
+ASYNC_IMAP_LINE_LIMIT = 64 * 1024 * 1024
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+_UNTAGGED_NUMBERED_RE = re.compile(rb'^\* (\d+) ([A-Z-]+)(?: (.*))?$', re.DOTALL)
+_UNTAGGED_CODE_RE = re.compile(rb'^\* (?:OK|NO|BAD) \[([A-Z0-9-]+)(?: ([^\]]*))?\]')
+_UNTAGGED_RE = re.compile(rb'^\* ([A-Z-]+)(?: (.*))?$', re.DOTALL)
+
+class AsyncIMAPError(Exception):
+    """Réponse NO/BAD du serveur IMAP ou connexion interrompue"""
+
+class IMAPLiteral(bytes):
+    """Argument de commande envoyé en littéral IMAP ({n} puis les octets), quel que soit son contenu"""
+
+class AsyncIMAPClient:
+    """Client IMAP minimal sur les flux asyncio (SSL), sans thread par connexion
+
+    Les réponses non sollicitées sont regroupées comme dans imaplib ({type: [données]}),
+    ce qui permet de réutiliser les mêmes fonctions d'analyse que mail_utils.
+    """
+
+    def __init__(self, host=IMAP_SERVER, port=IMAP_SSL_PORT, timeout=ASYNC_IMAP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.capabilities = ()
+        self.untagged_responses = {}
+        self._reader = None
+        self._writer = None
+        self._tag_counter = 0
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context(), limit=ASYNC_IMAP_LINE_LIMIT
+            ),
+            self.timeout
+        )
+        greeting = await self._read_line()
+        if not greeting.startswith(b'* OK'):
+            raise AsyncIMAPError(f"Accueil IMAP inattendu : {greeting!r}")
+
+    async def _read_line(self):
+        line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+        if not line:
+            raise AsyncIMAPError("Connexion IMAP fermée par le serveur")
+        return line.rstrip(b'\r\n')
+
+    async def _read_response(self):
+        """Lit une réponse complète : liste d'éléments au format imaplib (octets ou (préfixe, littéral))"""
+        items = []
+        line = await self._read_line()
+        while True:
+            match = _LITERAL_RE.search(line)
+            if not match:
+                items.append(line)
+                return items
+            literal = await asyncio.wait_for(self._reader.readexactly(int(match.group(1))), self.timeout)
+            items.append((line, literal))
+            line = await self._read_line()
+
+    def _store_untagged(self, items):
+        """Range une réponse non sollicitée sous son type, comme imaplib.untagged_responses"""
+        head = items[0][0] if isinstance(items[0], tuple) else items[0]
+
+        code = _UNTAGGED_CODE_RE.match(head)
+        if code:
+            self.untagged_responses.setdefault(code.group(1).decode(), []).append(code.group(2))
+            return
+
+        numbered = _UNTAGGED_NUMBERED_RE.match(head)
+        if numbered:
+            key = numbered.group(2).decode()
+            data = numbered.group(1) + (b' ' + numbered.group(3) if numbered.group(3) is not None else b'')
+        else:
+            plain = _UNTAGGED_RE.match(head)
+            if not plain:
+                return
+            key = plain.group(1).decode()
+            data = plain.group(2) or b''
+
+        # Retirer "* " et le type du premier élément, garder les littéraux tels quels
+        first = (data, items[0][1]) if isinstance(items[0], tuple) else data
+        self.untagged_responses.setdefault(key, []).extend([first] + items[1:])
+
+    async def command(self, name, *args):
+        """Envoie une commande et attend sa réponse étiquetée ; renvoie (statut, texte)"""
+        self._tag_counter += 1
+        tag = f"A{self._tag_counter:04d}".encode()
+        parts = [tag, name.encode()]
+        for arg in args:
+            if isinstance(arg, IMAPLiteral):
+                # Littéral : annoncer sa taille et attendre l'invite "+" du serveur avant les octets
+                parts.append(b'{%d}' % len(arg))
+                self._writer.write(b' '.join(parts) + b'\r\n')
+                await self._writer.drain()
+                await self._wait_continuation(tag)
+                parts = [bytes(arg)]
+            else:
+                parts.append(arg.encode() if isinstance(arg, str) else arg)
+        self._writer.write(b' '.join(parts) + b'\r\n')
+        await self._writer.drain()
+
+        while True:
+            items = await self._read_response()
+            head = items[0][0] if isinstance(items[0], tuple) else items[0]
+            if head.startswith(tag + b' '):
+                status, _, text = head[len(tag) + 1:].partition(b' ')
+                return status.decode(), text.decode('utf-8', errors='replace')
+            if head.startswith(b'* '):
+                self._store_untagged(items)
+
+    async def _wait_continuation(self, tag):
+        """Attend l'invite "+" d'un littéral ; une réponse étiquetée à la place signifie un refus"""
+        while True:
+            items = await self._read_response()
+            head = items[0][0] if isinstance(items[0], tuple) else items[0]
+            if head.startswith(b'+'):
+                return
+            if head.startswith(tag + b' '):
+                raise AsyncIMAPError(f"Littéral refusé : {head.decode('utf-8', errors='replace')}")
+            if head.startswith(b'* '):
+                self._store_untagged(items)
+
+    async def _checked(self, name, *args):
+        status, text = await self.command(name, *args)
+        if status != 'OK':
+            raise AsyncIMAPError(f"{name} : {status} {text}")
+        return text
+
+    def response(self, name):
+        """Retire et renvoie les réponses non sollicitées d'un type donné"""
+        return self.untagged_responses.pop(name, [])
+
+    async def login(self, username, password):
+        # Identifiants en littéraux : guillemets, barres obliques inverses et caractères non ASCII passent tels quels
+        await self._checked('LOGIN', IMAPLiteral(username.encode()), IMAPLiteral(password.encode()))
+        self.untagged_responses.pop('CAPABILITY', None)
+        await self._checked('CAPABILITY')
+        capabilities = self.response('CAPABILITY')
+        self.capabilities = tuple(capabilities[-1].decode().upper().split()) if capabilities else ()
+
+    async def select(self, folder, readonly=True):
+        self.untagged_responses = {}
+        await self._checked('EXAMINE' if readonly else 'SELECT', _quote_mailbox(folder))
+
+    async def uid(self, command, *args):
+        """Commande UID (SEARCH, FETCH...) ; renvoie les données non sollicitées correspondantes"""
+        self.untagged_responses.pop(command.upper(), None)
+        await self._checked('UID', command, *args)
+        return self.response(command.upper())
+
+    async def logout(self):
+        try:
+            await self.command('LOGOUT')
+        except Exception:
+            pass
+        finally:
+            if self._writer:
+                self._writer.close()
+
+async def _open_client(username, password):
+    client = AsyncIMAPClient()
+    await client.connect()
+    try:
+        await client.login(username, password)
+    except Exception:
+        await client.logout()
+        raise
+    return client
+
+async def async_test_gmail_connection(email_address, password):
+    """Équivalent asynchrone de auth_utils.test_gmail_connection (sans affichage Streamlit)"""
+    try:
+        client = await _open_client(email_address, password)
+        await client.logout()
+        return True
+    except Exception:
+        return False
+
+async def _async_stream_message(client, uid, size=None):
+    """Équivalent asynchrone de mail_utils._stream_message : message lu par FETCH partiels successifs"""
+    from config import MAX_MESSAGE_SIZE
+
+    parser = StreamingMessageParser()
+    offset = 0
+    while offset < MAX_MESSAGE_SIZE:
+        length = min(MESSAGE_CHUNK_SIZE, MAX_MESSAGE_SIZE - offset)
+        chunk_data = await client.uid('FETCH', str(uid), f"(BODY.PEEK[]<{offset}.{length}>)")
+        chunk = next(
+            (value for record in _parse_fetch_response(chunk_data)
+             for key, value in record.items() if key.startswith("BODY[]")),
+            None
+        )
+        if not isinstance(chunk, bytes) or not chunk:
+            break
+        parser.feed(chunk)
+        if len(chunk) < length:
+            break
+        offset += len(chunk)
+
+    streamed = parser.close()
+    if size and size > MAX_MESSAGE_SIZE:
+        streamed["truncated"] = True
+    return streamed
+
+async def async_fetch_emails_from_category(credentials, category_folder, since_date=None, limit=50, batch_size=IMAP_FETCH_BATCH_SIZE, headers_only=False):
+    """Équivalent asynchrone de fetch_emails_from_category ; les erreurs sont propagées à l'appelant"""
+    client = await _open_client(credentials["email"], credentials["password"])
+    try:
+        await client.select(category_folder, readonly=True)
+        uidvalidity = client.untagged_responses.get('UIDVALIDITY', [None])[-1]
+        uidvalidity = int(uidvalidity) if uidvalidity else None
+
+        search_criteria = "ALL"
+        if since_date and hasattr(since_date, 'strftime'):
+            search_criteria = f"(SINCE {since_date.strftime('%d-%b-%Y')})"
+        search_data = await client.uid('SEARCH', search_criteria)
+        email_uids = b' '.join(item for item in search_data if isinstance(item, bytes)).split()
+        selected_uids = email_uids[-limit:] if limit else email_uids
+
+        gmail_attributes = "X-GM-EXT-1" in client.capabilities
+        fetch_items = _fetch_items_for(headers_only, gmail_attributes)
+
+        emails = []
+        for batch_start in range(0, len(selected_uids), batch_size):
+            batch = selected_uids[batch_start:batch_start + batch_size]
+            fetch_data = await client.uid('FETCH', _compress_uid_set(batch), fetch_items)
+            records = _parse_fetch_response(fetch_data)
+            if headers_only:
+                # Aperçu : début de la partie texte quand ce n'est pas la section 1
+                for section, uids in _snippet_part_requests(records).items():
+                    part_data = await client.uid('FETCH', _compress_uid_set(uids), _snippet_fetch_items(section))
+                    _merge_part_records(records, part_data)
+            else:
+                # Seconde passe : uniquement les parties texte choisies d'après la BODYSTRUCTURE
+                for section, uids in _text_part_requests(records).items():
+                    part_data = await client.uid('FETCH', _compress_uid_set(uids), _text_part_fetch_items(section))
+                    _merge_part_records(records, part_data)
+                # Sans BODYSTRUCTURE exploitable, lire le message par morceaux (comme _iter_uid_batches)
+                for record in records:
+                    if "BODYSTRUCTURE" not in record and record.get("UID"):
+                        try:
+                            record["STREAMED"] = await _async_stream_message(
+                                client, record["UID"], int(record.get("RFC822.SIZE") or 0)
+                            )
+                        except AsyncIMAPError:
+                            continue
+            for record in records:
+                try:
+                    email_data = _email_from_fetch_record(
+                        record, category_folder, since_date, headers_only, gmail_attributes, uidvalidity
+                    )
+                    if email_data:
+                        emails.append(email_data)
+                except Exception:
+                    continue
+
+        return sort_emails_by_date(emails)
+    finally:
+        await client.logout()
+
+async def async_fetch_all_categorized_emails(credentials, since_date=None, limit_per_category=50, headers_only=False):
+    """Récupère toutes les catégories d'un utilisateur en parallèle sur la boucle asyncio"""
+    # Rester sous la limite de connexions simultanées par compte Gmail
+    semaphore = asyncio.Semaphore(min(5, MAX_CONNECTIONS_PER_USER))
+    categories = get_gmail_categories()
+
+    async def fetch_category(folder_name):
+        async with semaphore:
+            try:
+                return await async_fetch_emails_from_category(
+                    credentials, folder_name, since_date, limit_per_category, headers_only=headers_only
+                )
+            except Exception:
+                return []
+
+    results = await asyncio.gather(*(fetch_category(folder_name) for folder_name in categories.values()))
+    return dict(zip(categories.keys(), results))
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+def get_background_loop():
+    """Renvoie la boucle asyncio d'arrière-plan du processus (démarrée au premier appel)"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="async-imap", daemon=True).start()
+        return _background_loop
+
+def run_in_background(coroutine):
+    """Planifie une coroutine sur la boucle d'arrière-plan ; renvoie un concurrent.futures.Future"""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_background_loop())
@@ -12,6 +12,12 @@ SUPABASE_KEY = st.secrets.get("SUPABASE_KEY") or os.getenv("SUPABASE_KEY")
 # Configuration OpenAI
 OPENAI_API_KEY = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
 
+# Taille maximale lue pour un message téléchargé en entier (au-delà, le reste est ignoré)
+MAX_MESSAGE_SIZE = int(st.secrets.get("MAX_MESSAGE_SIZE") or os.getenv("MAX_MESSAGE_SIZE") or 25 * 1024 * 1024)
+
+# Miroir SQLite local de user_emails (optionnel) : chemin du fichier, vide pour le désactiver
+LOCAL_MIRROR_PATH = st.secrets.get("LOCAL_MIRROR_PATH") or os.getenv("LOCAL_MIRROR_PATH")
+
 # Validation des variables d'environnement obligatoires
 required_vars = {
     "SUPABASE_URL": SUPABASE_URL,
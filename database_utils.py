@@ -1,120 +1,265 @@
 import streamlit as st
 from supabase import create_client, Client
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 import uuid
 import hashlib
-from config import SUPABASE_URL, SUPABASE_KEY
-import email.utils
-
-def parse_email_date(date_str):
-    """Parse une date d'email en objet datetime avec gestion des timezones"""
-    try:
-        if not date_str or date_str.strip() == "":
-            return datetime.now(timezone.utc)
-            
-        try:
-            parsed_date = email.utils.parsedate_to_datetime(date_str)
-            if parsed_date.tzinfo is None:
-                parsed_date = parsed_date.replace(tzinfo=timezone.utc)
-            return parsed_date
-        except:
-            pass
-        
-        formats = [
-            "%a, %d %b %Y %H:%M:%S %z",
-            "%d %b %Y %H:%M:%S %z",
-            "%a, %d %b %Y %H:%M:%S %Z",
-            "%d %b %Y %H:%M:%S %Z",
-            "%a, %d %b %Y %H:%M:%S",
-            "%d %b %Y %H:%M:%S"
-        ]
-        
-        for fmt in formats:
-            try:
-                parsed = datetime.strptime(date_str, fmt)
-                if parsed.tzinfo is None:
-                    parsed = parsed.replace(tzinfo=timezone.utc)
-                return parsed
-            except ValueError:
-                continue
-        
-        return datetime.now(timezone.utc)
-    except Exception:
-        return datetime.now(timezone.utc)
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import SUPABASE_URL, SUPABASE_KEY, LOCAL_MIRROR_PATH
+from date_utils import parse_email_date
+from local_mirror import LocalMirror, MIRROR_COLUMNS, local_email_id, parse_local_email_id
 
 # Client Supabase
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Miroir SQLite local optionnel : lectures locales, écritures locales d'abord puis répliquées
+local_mirror = LocalMirror(LOCAL_MIRROR_PATH) if LOCAL_MIRROR_PATH else None
+
+# Intervalle minimal entre deux rattrapages du miroir depuis Supabase (secondes)
+MIRROR_REFRESH_INTERVAL = 30
+
+# Nombre de lignes lues par requête de rattrapage
+MIRROR_CATCH_UP_PAGE_SIZE = 500
+
+# Recouvrement du rattrapage (secondes) : updated_at est posé à l'ouverture de la transaction (migrations/013),
+# une ligne validée après une autre peut donc porter une date antérieure au curseur
+MIRROR_CATCH_UP_OVERLAP = 60
+
+_mirror_refreshed_at = {}
+
+# Rejets (hors pannes réseau) au-delà desquels une écriture en attente part dans outbox_dead_letters
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Un rejeu à la fois par utilisateur : les threads de synchronisation parallèles ne rejouent pas deux fois la même écriture
+_outbox_locks = {}
+
+# Colonnes des requêtes de liste : le corps complet n'est lu qu'à l'ouverture (get_email_body)
+EMAIL_LIST_COLUMNS = 'id, email_id, sender, recipient, subject, date_received, category, is_processed, snippet'
+
+# Marqueurs des termes trouvés dans les extraits de recherche (caractères de contrôle, absents des emails)
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Nombre maximal de résultats d'une recherche
+SEARCH_LIMIT = 50
+
+# Catégorie par défaut : un email également classé dans un onglet garde la catégorie de l'onglet
+DEFAULT_CATEGORY = 'Boîte de réception'
+
+# Préfixes des identifiants stables (generate_email_id) ; les autres sont des identifiants d'avant migrations/003
+STABLE_EMAIL_ID_PREFIXES = ('gm:', 'mid:', 'uid:')
+
+# Nombre d'anciens identifiants recherchés par requête (valeurs longues : chaîne composite avec le sujet)
+LEGACY_LOOKUP_CHUNK_SIZE = 50
+
+_users_with_legacy_ids = {}
+
 def generate_email_id(email_data):
-    """Génère un ID unique pour un email basé sur son contenu"""
+    """Génère un ID court et stable pour un email : X-GM-MSGID, sinon Message-ID, sinon dossier/UIDVALIDITY/UID"""
     try:
+        if email_data.get('gm_msgid'):
+            return f"gm:{email_data['gm_msgid']}"
+        
+        message_id = (email_data.get('message_id') or '').strip()
+        if message_id:
+            return "mid:" + hashlib.sha1(message_id.encode()).hexdigest()[:24]
+        
+        if email_data.get('folder') and email_data.get('uidvalidity') and email_data.get('uid'):
+            location = f"{email_data['folder']}:{email_data['uidvalidity']}:{email_data['uid']}"
+            return "uid:" + hashlib.sha1(location.encode()).hexdigest()[:24]
+        
+        # Dernier recours : empreinte du contenu
         content = f"{email_data.get('from', '')}{email_data.get('subject', '')}{email_data.get('date', '')}{email_data.get('body', '')[:100]}"
         return hashlib.md5(content.encode()).hexdigest()
     except Exception:
         return str(uuid.uuid4())
 
+def _build_email_record(user_id, email_data, email_id=None):
+    """Construit la ligne user_emails correspondant à un email IMAP"""
+    date_received = email_data.get('date_parsed') or parse_email_date(email_data.get('date', ''))
+    
+    if date_received is None:
+        date_received = datetime.now(timezone.utc)
+    elif date_received.tzinfo is None:
+        date_received = date_received.replace(tzinfo=timezone.utc)
+    
+    if not email_id:
+        email_id = generate_email_id(email_data)
+    
+    from mail_utils import SNIPPET_LENGTH
+    
+    body = email_data.get('body', '')
+    return {
+        'user_id': user_id,
+        'email_id': email_id,
+        'subject': email_data.get('subject', ''),
+        'sender': email_data.get('from', ''),
+        'recipient': email_data.get('to', ''),
+        'body': body,
+        'snippet': email_data.get('snippet') or ' '.join(body.split())[:SNIPPET_LENGTH],
+        'date_received': date_received.isoformat(),
+        'category': email_data.get('category', DEFAULT_CATEGORY),  # Nouvelle colonne catégorie
+        'imap_folder': email_data.get('folder'),
+        'imap_uid': int(email_data['uid']) if email_data.get('uid') else None,
+        'imap_uidvalidity': email_data.get('uidvalidity'),
+        'is_processed': bool(email_data.get('is_processed', False)),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }
+
+def _legacy_email_ids(email_data):
+    """Identifiants qu'un email avait avant migrations/003 : chaîne composite dossier_expéditeur_sujet_date, ou MD5 du contenu"""
+    legacy_ids = []
+    if email_data.get('folder'):
+        legacy_ids.append(f"{email_data['folder']}_{email_data.get('from', '')}_{email_data.get('subject', '')}_{email_data.get('date', '')}")
+    content = f"{email_data.get('from', '')}{email_data.get('subject', '')}{email_data.get('date', '')}{email_data.get('body', '')[:100]}"
+    legacy_ids.append(hashlib.md5(content.encode()).hexdigest())
+    return legacy_ids
+
+def _has_legacy_rows(user_id):
+    """Indique si l'utilisateur a encore des lignes sous un ancien identifiant (revérifié après chaque renommage)"""
+    if user_id not in _users_with_legacy_ids:
+        query = supabase.table('user_emails').select('id').eq('user_id', user_id)
+        for prefix in STABLE_EMAIL_ID_PREFIXES:
+            query = query.not_.like('email_id', f'{prefix}%')
+        _users_with_legacy_ids[user_id] = bool(query.limit(1).execute().data)
+    return _users_with_legacy_ids[user_id]
+
+def _rekey_legacy_rows(user_id, emails_by_id):
+    """Renomme sous leur identifiant stable les lignes encore stockées sous un ancien identifiant
+    
+    emails_by_id : {nouvel email_id: email IMAP} pour des emails absents de la base sous ce nouvel
+    identifiant. La ligne garde son id (résumés et réponses restent attachés) ; au lieu d'être insérée
+    en double, elle est mise à jour. Renvoie {nouvel email_id: ligne (id, category, is_processed)}.
+    """
+    if not emails_by_id or not _has_legacy_rows(user_id):
+        return {}
+    
+    new_ids_by_legacy = {}
+    for new_id, email_data in emails_by_id.items():
+        for legacy_id in _legacy_email_ids(email_data):
+            new_ids_by_legacy.setdefault(legacy_id, new_id)
+    
+    legacy_ids = list(new_ids_by_legacy)
+    rekeyed = {}
+    for start in range(0, len(legacy_ids), LEGACY_LOOKUP_CHUNK_SIZE):
+        result = supabase.table('user_emails').select('id, email_id, category, is_processed').eq('user_id', user_id).in_(
+            'email_id', legacy_ids[start:start + LEGACY_LOOKUP_CHUNK_SIZE]
+        ).execute()
+        for row in result.data or []:
+            new_id = new_ids_by_legacy[row['email_id']]
+            # Deux anciennes lignes pour le même message : la seconde reste un doublon (migrations/012)
+            if new_id in rekeyed:
+                continue
+            supabase.table('user_emails').update({'email_id': new_id}).eq('id', row['id']).execute()
+            rekeyed[new_id] = dict(row, email_id=new_id)
+    
+    if rekeyed:
+        # Peut-être les dernières anciennes lignes : revérifier au prochain appel
+        _users_with_legacy_ids.pop(user_id, None)
+    return rekeyed
+
+def _legacy_fields(email_data):
+    """Champs d'un email nécessaires pour retrouver son ancien identifiant (conservés dans la file d'attente)"""
+    fields = {key: email_data.get(key) or '' for key in ('folder', 'from', 'subject', 'date')}
+    fields['body'] = (email_data.get('body') or '')[:100]
+    return fields
+
+def _save_email_record_remote(user_id, email_record, legacy_fields):
+    """Enregistre une ligne user_emails dans Supabase (lève une exception en cas d'échec) ; renvoie son id"""
+    # Vérifier si l'email existe déjà
+    existing = supabase.table('user_emails').select('id, category, is_processed').eq('user_id', user_id).eq('email_id', email_record['email_id']).execute()
+    if not existing.data:
+        # Message stocké avant migrations/003 sous un ancien identifiant : le reprendre
+        rekeyed = _rekey_legacy_rows(user_id, {email_record['email_id']: legacy_fields})
+        existing.data = list(rekeyed.values())
+    
+    if existing.data:
+        # Ligne existante, comme dans _sync_email_records_remote : conserver la date de création et
+        # l'état de traitement, et ne pas remplacer la catégorie d'un onglet par la boîte de réception
+        email_record = {key: value for key, value in email_record.items() if key not in ('created_at', 'is_processed')}
+        if email_record['category'] == DEFAULT_CATEGORY and existing.data[0].get('category'):
+            email_record['category'] = existing.data[0]['category']
+        
+        # Mettre à jour l'email existant
+        result = supabase.table('user_emails').update(email_record).eq('id', existing.data[0]['id']).execute()
+        _mirror_rows(result.data)
+        _apply_counter_changes(user_id, removed=existing.data[:1], added=[dict(existing.data[0], category=email_record['category'])])
+        return existing.data[0]['id']
+    
+    # Insérer un nouveau email
+    result = supabase.table('user_emails').insert(email_record).execute()
+    if result.data:
+        _mirror_rows(result.data)
+        _apply_counter_changes(user_id, added=[email_record])
+    return result.data[0]['id'] if result.data else None
+
+def _write_email_records_locally(user_id, records):
+    """Écrit des lignes user_emails dans le miroir seul (Supabase injoignable) ; renvoie {email_id: id}
+    
+    Les lignes inconnues du miroir reçoivent un id provisoire (local_email_id), remplacé par la
+    ligne Supabase quand l'écriture est rejouée.
+    """
+    ids = {}
+    for start in range(0, len(records), UPSERT_CHUNK_SIZE):
+        chunk = records[start:start + UPSERT_CHUNK_SIZE]
+        existing = {row['email_id']: row for row in local_mirror.find_emails(user_id, [record['email_id'] for record in chunk])}
+        rows = []
+        for record in chunk:
+            row = existing.get(record['email_id'])
+            if row is None:
+                rows.append(dict(record, id=local_email_id(user_id, record['email_id'])))
+                continue
+            # Mêmes règles que Supabase : date de création conservée, onglet préféré à la boîte de réception
+            record = {key: value for key, value in record.items() if key not in ('created_at', 'is_processed')}
+            if record['category'] == DEFAULT_CATEGORY and row.get('category'):
+                record['category'] = row['category']
+            rows.append(dict(record, id=row['id']))
+        local_mirror.upsert_emails(rows)
+        ids.update((row['email_id'], row['id']) for row in rows)
+    return ids
+
+def _save_email_record_locally(user_id, email_record):
+    """Équivalent local de _save_email_record_remote (miroir seul) ; renvoie l'id local"""
+    return _write_email_records_locally(user_id, [email_record])[email_record['email_id']]
+
 def save_email_to_supabase(user_id, email_data, email_id=None):
     """Sauvegarde un email dans la base de données Supabase avec catégorie"""
     try:
-        date_received = parse_email_date(email_data.get('date', ''))
-        
-        if date_received is None:
-            date_received = datetime.now(timezone.utc)
-        elif date_received.tzinfo is None:
-            date_received = date_received.replace(tzinfo=timezone.utc)
-        
-        if not email_id:
-            email_id = generate_email_id(email_data)
-        
-        email_record = {
-            'user_id': user_id,
-            'email_id': email_id,
-            'subject': email_data.get('subject', ''),
-            'sender': email_data.get('from', ''),
-            'recipient': email_data.get('to', ''),
-            'body': email_data.get('body', ''),
-            'date_received': date_received.isoformat(),
-            'category': email_data.get('category', 'Boîte de réception'),  # Nouvelle colonne catégorie
-            'is_processed': False,
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        }
-        
-        # Vérifier si l'email existe déjà
-        existing = supabase.table('user_emails').select('id').eq('user_id', user_id).eq('email_id', email_record['email_id']).execute()
-        
-        if existing.data:
-            # Mettre à jour l'email existant
-            result = supabase.table('user_emails').update(email_record).eq('id', existing.data[0]['id']).execute()
-            return existing.data[0]['id']
-        else:
-            # Insérer un nouveau email
-            result = supabase.table('user_emails').insert(email_record).execute()
-            return result.data[0]['id'] if result.data else None
+        email_record = _build_email_record(user_id, email_data, email_id)
+        return _remote_or_queued(
+            'save_email_record',
+            {'user_id': user_id, 'email_record': email_record, 'legacy_fields': _legacy_fields(email_data)},
+            lambda: _save_email_record_locally(user_id, email_record)
+        )
             
     except Exception as e:
         st.error(f"Erreur lors de la sauvegarde de l'email : {str(e)}")
         return None
 
+def _since_date_iso(since_date):
+    """Convertit le filtre de date (date, datetime ou chaîne) en horodatage ISO UTC"""
+    if hasattr(since_date, 'date'):
+        if since_date.tzinfo is None:
+            since_date = since_date.replace(tzinfo=timezone.utc)
+        return since_date.isoformat()
+    if hasattr(since_date, 'isoformat'):
+        return datetime.combine(since_date, datetime.min.time()).replace(tzinfo=timezone.utc).isoformat()
+    return since_date
+
 def get_user_emails_from_supabase(user_id, since_date=None, limit=50):
     """Récupère les emails d'un utilisateur depuis Supabase avec gestion correcte des dates"""
     try:
-        query = supabase.table('user_emails').select('*').eq('user_id', user_id).order('date_received', desc=True)
+        if local_mirror is not None:
+            refresh_local_mirror(user_id)
+            since = _since_date_iso(since_date) if since_date else None
+            return local_mirror.list_emails_page(user_id, EMAIL_LIST_COLUMNS, since=since, page_size=limit or -1)
+        
+        query = supabase.table('user_emails').select(EMAIL_LIST_COLUMNS).eq('user_id', user_id).order('date_received', desc=True)
         
         if since_date:
-            if hasattr(since_date, 'date'):
-                if since_date.tzinfo is None:
-                    since_datetime = since_date.replace(tzinfo=timezone.utc)
-                else:
-                    since_datetime = since_date
-                since_date_str = since_datetime.isoformat()
-            elif hasattr(since_date, 'isoformat'):
-                since_datetime = datetime.combine(since_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-                since_date_str = since_datetime.isoformat()
-            else:
-                since_date_str = since_date
-            
-            query = query.gte('date_received', since_date_str)
+            query = query.gte('date_received', _since_date_iso(since_date))
         
         if limit:
             query = query.limit(limit)
@@ -126,61 +271,278 @@ def get_user_emails_from_supabase(user_id, since_date=None, limit=50):
         st.error(f"Erreur lors de la récupération des emails : {str(e)}")
         return []
 
+def _get_category_emails_limited(user_id, category, since_date_str, limit):
+    """Récupère les emails les plus récents d'une seule catégorie, limités côté serveur"""
+    query = supabase.table('user_emails').select(EMAIL_LIST_COLUMNS).eq('user_id', user_id).eq('category', category)
+    if since_date_str:
+        query = query.gte('date_received', since_date_str)
+    return query.order('date_received', desc=True).order('id', desc=True).limit(limit).execute().data or []
+
+def _group_by_category(rows):
+    """Organise des lignes user_emails par catégorie (ordre décroissant de date conservé)"""
+    emails_by_category = {}
+    for email in rows:
+        category = email.get('category') or DEFAULT_CATEGORY
+        emails_by_category.setdefault(category, []).append(email)
+    return emails_by_category
+
 def get_user_emails_by_category(user_id, since_date=None, categories=None, limit_per_category=50):
-    """Récupère les emails d'un utilisateur organisés par catégorie"""
+    """Récupère les emails d'un utilisateur organisés par catégorie (limite par catégorie appliquée en base)"""
     try:
-        # Construire la requête de base
-        query = supabase.table('user_emails').select('*').eq('user_id', user_id)
+        since_date_str = _since_date_iso(since_date) if since_date else None
         
-        # Filtrer par date si spécifiée
-        if since_date:
-            if hasattr(since_date, 'date'):
-                if since_date.tzinfo is None:
-                    since_datetime = since_date.replace(tzinfo=timezone.utc)
-                else:
-                    since_datetime = since_date
-                since_date_str = since_datetime.isoformat()
-            elif hasattr(since_date, 'isoformat'):
-                since_datetime = datetime.combine(since_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-                since_date_str = since_datetime.isoformat()
-            else:
-                since_date_str = since_date
-            
-            query = query.gte('date_received', since_date_str)
+        if local_mirror is not None:
+            refresh_local_mirror(user_id)
+            rows = local_mirror.list_emails_by_category(
+                user_id, EMAIL_LIST_COLUMNS, since_date_str, list(categories) if categories else None, limit_per_category
+            )
+            return _group_by_category(rows)
         
-        # Filtrer par catégories si spécifiées
-        if categories:
-            query = query.in_('category', categories)
+        try:
+            # Fonction SQL (migrations/004) : row_number() par catégorie, seules les lignes affichées transitent
+            result = supabase.rpc('get_user_emails_by_category', {
+                'p_user_id': user_id,
+                'p_since': since_date_str,
+                'p_categories': list(categories) if categories else None,
+                'p_limit_per_category': limit_per_category
+            }).execute()
+            rows = result.data or []
+        except Exception:
+            # Fonction absente : une requête limitée par catégorie, en parallèle
+            if not categories:
+                from mail_utils import get_gmail_categories
+                categories = list(get_gmail_categories().keys())
+            with ThreadPoolExecutor(max_workers=len(categories)) as executor:
+                per_category = executor.map(
+                    lambda category: _get_category_emails_limited(user_id, category, since_date_str, limit_per_category),
+                    categories
+                )
+                rows = [email for emails in per_category for email in emails]
         
-        # Ordonner par date
-        query = query.order('date_received', desc=True)
+        return _group_by_category(rows)
         
-        # Récupérer tous les emails (on limitera par catégorie après)
-        result = query.execute()
+    except Exception as e:
+        st.error(f"Erreur lors de la récupération des emails par catégorie : {str(e)}")
+        return {}
+
+def get_user_emails_page(user_id, category=None, since_date=None, page_size=50, cursor=None):
+    """Récupère une page d'emails triés par (date_received, id) décroissants, à partir d'un curseur
+    
+    cursor est le (date_received, id) du dernier email de la page précédente (None pour la première).
+    Renvoie (emails, curseur suivant ou None s'il n'y a plus de page).
+    """
+    try:
+        since = _since_date_iso(since_date) if since_date else None
         
-        # Organiser par catégorie
-        emails_by_category = {}
-        for email in result.data:
-            category = email.get('category', 'Boîte de réception')
-            if category not in emails_by_category:
-                emails_by_category[category] = []
+        if local_mirror is not None:
+            refresh_local_mirror(user_id)
+            # Une ligne de plus que la page pour savoir s'il en reste
+            rows = local_mirror.list_emails_page(user_id, EMAIL_LIST_COLUMNS, category, since, page_size + 1, cursor)
+        else:
+            query = supabase.table('user_emails').select(EMAIL_LIST_COLUMNS).eq('user_id', user_id)
             
-            # Limiter le nombre d'emails par catégorie
-            if len(emails_by_category[category]) < limit_per_category:
-                emails_by_category[category].append(email)
+            if category:
+                query = query.eq('category', category)
+            if since:
+                query = query.gte('date_received', since)
+            
+            if cursor:
+                # Pagination par clé : strictement après le dernier (date_received, id) affiché
+                last_date, last_id = cursor
+                query = query.or_(
+                    f'date_received.lt."{last_date}",and(date_received.eq."{last_date}",id.lt."{last_id}")'
+                )
+            
+            # Une ligne de plus que la page pour savoir s'il en reste
+            result = query.order('date_received', desc=True).order('id', desc=True).limit(page_size + 1).execute()
+            rows = result.data or []
         
-        return emails_by_category
+        emails = rows[:page_size]
+        next_cursor = None
+        if len(rows) > page_size:
+            next_cursor = (emails[-1]['date_received'], emails[-1]['id'])
+        return emails, next_cursor
         
     except Exception as e:
-        st.error(f"Erreur lors de la récupération des emails par catégorie : {str(e)}")
-        return {}
+        st.error(f"Erreur lors de la récupération des emails : {str(e)}")
+        return [], None
+
+def get_user_emails_pages(user_id, cursors, since_date=None, page_size=50):
+    """Récupère la page suivante de plusieurs catégories : {catégorie: (emails, curseur suivant ou None)}
+    
+    cursors associe à chaque catégorie le (date_received, id) de son dernier email affiché, ou None.
+    Les premières pages arrivent en un seul appel (get_user_emails_by_category), les suivantes par curseur.
+    """
+    pages = {}
+    first_pages = [category for category, cursor in cursors.items() if cursor is None]
+    if first_pages:
+        # Une ligne de plus par catégorie pour savoir s'il en reste
+        emails_by_category = get_user_emails_by_category(user_id, since_date, first_pages, limit_per_category=page_size + 1)
+        for category in first_pages:
+            rows = emails_by_category.get(category, [])
+            emails = rows[:page_size]
+            next_cursor = (emails[-1]['date_received'], emails[-1]['id']) if len(rows) > page_size else None
+            pages[category] = (emails, next_cursor)
+    
+    for category, cursor in cursors.items():
+        if cursor is not None:
+            pages[category] = get_user_emails_page(user_id, category, since_date, page_size, cursor)
+    return pages
+
+def get_email_body(user_id, email_id):
+    """Récupère le corps complet d'un email stocké (vue détail)"""
+    try:
+        if local_mirror is not None:
+            body = local_mirror.get_email_body(user_id, email_id)
+            if body is not None:
+                return body
+        
+        result = supabase.table('user_emails').select('body').eq('user_id', user_id).eq('id', email_id).execute()
+        if not result.data:
+            return None
+        return result.data[0].get('body') or ''
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la récupération du contenu de l'email : {str(e)}")
+        return None
+
+def search_emails(user_id, query, category=None, since=None, limit=SEARCH_LIMIT):
+    """Recherche plein texte dans les emails stockés (sujet, expéditeur, corps), classée par pertinence
+    
+    Utilise l'index FTS5 du miroir local s'il est actif, sinon l'index GIN de Supabase (migrations/010).
+    Chaque résultat porte 'rank' et 'highlight' (extrait, termes entre HIGHLIGHT_START et HIGHLIGHT_END).
+    """
+    if not query or not query.strip():
+        return []
+    
+    try:
+        since_str = _since_date_iso(since) if since else None
+        
+        if local_mirror is not None and local_mirror.has_fts:
+            refresh_local_mirror(user_id)
+            return local_mirror.search_emails(
+                user_id, EMAIL_LIST_COLUMNS, query, category, since_str, limit, HIGHLIGHT_START, HIGHLIGHT_END
+            )
+        
+        result = supabase.rpc('search_user_emails', {
+            'p_user_id': user_id,
+            'p_query': query,
+            'p_category': category,
+            'p_since': since_str,
+            'p_limit': limit
+        }).execute()
+        return result.data or []
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la recherche : {str(e)}")
+        return []
 
 def get_user_emails(user_id, since_date=None, limit=50):
     """Alias pour get_user_emails_from_supabase pour compatibilité"""
     return get_user_emails_from_supabase(user_id, since_date, limit)
 
+def _increment_mailbox_counters(user_id, category=None, email_id=None, total=0, unprocessed=0, summarized=0, replied=0):
+    """Incrémente les compteurs de la barre latérale (catégorie donnée, ou celle de l'email user_emails.id)"""
+    try:
+        supabase.rpc('increment_mailbox_counters', {
+            'p_user_id': user_id,
+            'p_category': category,
+            'p_email_id': email_id,
+            'p_total': total,
+            'p_unprocessed': unprocessed,
+            'p_summarized': summarized,
+            'p_replied': replied
+        }).execute()
+    except Exception:
+        # Un incrément perdu est corrigé par reconcile_mailbox_counters
+        pass
+
+def _apply_counter_changes(user_id, removed=(), added=()):
+    """Répercute sur les compteurs des lignes user_emails retirées ou ajoutées (catégorie, is_processed)"""
+    deltas = {}
+    for rows, sign in ((removed, -1), (added, 1)):
+        for row in rows:
+            delta = deltas.setdefault(row.get('category') or DEFAULT_CATEGORY, [0, 0])
+            delta[0] += sign
+            if not row.get('is_processed'):
+                delta[1] += sign
+    
+    for category, (total, unprocessed) in deltas.items():
+        if total or unprocessed:
+            _increment_mailbox_counters(user_id, category=category, total=total, unprocessed=unprocessed)
+
+def reconcile_mailbox_counters(user_id=None):
+    """Recalcule les compteurs depuis les tables sources (un utilisateur, ou tous) ; renvoie les lignes"""
+    try:
+        result = supabase.rpc('reconcile_mailbox_counters', {'p_user_id': user_id}).execute()
+        return result.data or []
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la réconciliation des compteurs : {str(e)}")
+        return None
+
+def get_mailbox_statistics(user_id):
+    """Récupère toutes les statistiques de la barre latérale
+    
+    Renvoie total_emails, unprocessed_emails, summaries_generated, replies_sent,
+    categories ({catégorie: total}) et unprocessed_by_category ({catégorie: non traités}).
+    """
+    try:
+        # Compteurs tenus à jour par les écritures (migrations/008) : lecture par clé primaire
+        result = supabase.table('user_mailbox_counters').select(
+            'category, total, unprocessed, summarized, replied'
+        ).eq('user_id', user_id).execute()
+        counters = result.data
+        if not counters:
+            # Aucune ligne (utilisateurs existants initialisés par migrations/014) : recalculer depuis les tables sources
+            counters = reconcile_mailbox_counters(user_id)
+        if counters:
+            return {
+                'total_emails': sum(row['total'] for row in counters),
+                'unprocessed_emails': sum(row['unprocessed'] for row in counters),
+                'summaries_generated': sum(row['summarized'] for row in counters),
+                'replies_sent': sum(row['replied'] for row in counters),
+                'categories': {row['category']: row['total'] for row in counters},
+                'unprocessed_by_category': {row['category']: row['unprocessed'] for row in counters}
+            }
+    except Exception:
+        pass
+    
+    return _aggregate_mailbox_statistics(user_id)
+
+def _aggregate_mailbox_statistics(user_id):
+    """Calcule les statistiques de la barre latérale par agrégation en base, sans les compteurs"""
+    try:
+        # Fonction SQL (migrations/007) : agrégation GROUP BY côté base, coût indépendant du nombre d'emails
+        result = supabase.rpc('get_user_mailbox_statistics', {'p_user_id': user_id}).execute()
+        stats = result.data or {}
+        categories = stats.get('categories') or {}
+        
+        return {
+            'total_emails': sum(counts['total'] for counts in categories.values()),
+            'unprocessed_emails': sum(counts['unprocessed'] for counts in categories.values()),
+            'summaries_generated': stats.get('summaries_generated') or 0,
+            'replies_sent': stats.get('replies_sent') or 0,
+            'categories': {category: counts['total'] for category, counts in categories.items()},
+            'unprocessed_by_category': {category: counts['unprocessed'] for category, counts in categories.items()}
+        }
+        
+    except Exception:
+        # Fonction absente : requêtes de comptage séparées
+        category_counts = _count_category_statistics(user_id)
+        return {
+            **_count_user_statistics(user_id),
+            'unprocessed_emails': None,
+            'categories': category_counts,
+            'unprocessed_by_category': {}
+        }
+
 def get_category_statistics(user_id):
     """Récupère les statistiques par catégorie"""
+    return get_mailbox_statistics(user_id)['categories']
+
+def _count_category_statistics(user_id):
+    """Compte les emails par catégorie sans la fonction SQL d'agrégation"""
     try:
         # Compter les emails par catégorie
         result = supabase.table('user_emails').select('category').eq('user_id', user_id).execute()
@@ -207,6 +569,8 @@ def save_email_summary(user_id, email_id, summary_text):
         }
         
         result = supabase.table('email_summaries').insert(summary_record).execute()
+        if result.data:
+            _increment_mailbox_counters(user_id, email_id=email_id, summarized=1)
         return result.data[0]['id'] if result.data else None
         
     except Exception as e:
@@ -248,6 +612,8 @@ def save_email_reply(user_id, email_id, user_prompt, generated_reply, final_repl
         }
         
         result = supabase.table('email_replies').insert(reply_record).execute()
+        if result.data and was_sent:
+            _increment_mailbox_counters(user_id, email_id=email_id, replied=1)
         return result.data[0]['id'] if result.data else None
         
     except Exception as e:
@@ -257,11 +623,15 @@ def save_email_reply(user_id, email_id, user_prompt, generated_reply, final_repl
 def update_reply_sent_status(reply_id):
     """Met à jour le statut d'envoi d'une réponse"""
     try:
+        # Seule une réponse pas encore envoyée change d'état (et de compteur)
         result = supabase.table('email_replies').update({
             'was_sent': True,
             'sent_at': datetime.now(timezone.utc).isoformat()
-        }).eq('id', reply_id).execute()
+        }).eq('id', reply_id).eq('was_sent', False).execute()
         
+        if result.data:
+            reply = result.data[0]
+            _increment_mailbox_counters(reply['user_id'], email_id=reply['email_id'], replied=1)
         return result.data[0] if result.data else None
         
     except Exception as e:
@@ -314,6 +684,11 @@ def save_user_preference(user_id, preference_key, preference_value):
 
 def get_user_statistics(user_id):
     """Récupère les statistiques d'un utilisateur"""
+    stats = get_mailbox_statistics(user_id)
+    return {key: stats[key] for key in ('total_emails', 'summaries_generated', 'replies_sent')}
+
+def _count_user_statistics(user_id):
+    """Compte emails, résumés et réponses envoyées sans la fonction SQL d'agrégation"""
     try:
         emails_count = supabase.table('user_emails').select('id', count='exact').eq('user_id', user_id).execute()
         summaries_count = supabase.table('email_summaries').select('id', count='exact').eq('user_id', user_id).execute()
@@ -329,34 +704,361 @@ def get_user_statistics(user_id):
         st.error(f"Erreur lors de la récupération des statistiques : {str(e)}")
         return {'total_emails': 0, 'summaries_generated': 0, 'replies_sent': 0}
 
+def _mark_email_as_processed_remote(email_id):
+    """Marque un email comme traité dans Supabase (lève une exception en cas d'échec)"""
+    placeholder = parse_local_email_id(email_id)
+    if placeholder:
+        # Ligne créée pendant une panne : son id Supabase existe une fois sa création rejouée
+        user_id, stable_email_id = placeholder
+        found = supabase.table('user_emails').select('id').eq('user_id', user_id).eq('email_id', stable_email_id).execute()
+        if not found.data:
+            raise LookupError(f"Email {stable_email_id} pas encore créé dans Supabase")
+        email_id = found.data[0]['id']
+    
+    # Seul un email pas encore traité change d'état (et de compteur)
+    result = supabase.table('user_emails').update({
+        'is_processed': True,
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    }).eq('id', email_id).eq('is_processed', False).execute()
+    
+    if result.data:
+        row = result.data[0]
+        _increment_mailbox_counters(row['user_id'], category=row.get('category'), unprocessed=-1)
+    return result.data[0] if result.data else None
+
 def mark_email_as_processed(email_id):
     """Marque un email comme traité"""
     try:
-        result = supabase.table('user_emails').update({
-            'is_processed': True,
-            'updated_at': datetime.now(timezone.utc).isoformat()
-        }).eq('id', email_id).execute()
+        row = local_mirror.update_email(email_id, is_processed=True) if local_mirror is not None else None
+        if row is not None:
+            # Écriture locale immédiate, répliquée vers Supabase par la file d'attente
+            local_mirror.enqueue('mark_email_as_processed', {'email_id': email_id}, row['user_id'])
+            if not _replay_outbox(row['user_id']):
+                _warn_queued_writes()
+            return row
         
-        return result.data[0] if result.data else None
+        return _mark_email_as_processed_remote(email_id)
         
     except Exception as e:
         st.error(f"Erreur lors de la mise à jour : {str(e)}")
         return None
 
+def _is_network_error(error):
+    """Supabase injoignable (réseau, délai dépassé) plutôt qu'écriture rejetée par le serveur"""
+    if isinstance(error, OSError):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+def _warn_queued_writes():
+    st.warning("⚠️ Supabase injoignable : modifications enregistrées localement, réplication en attente")
+
+def _replay_outbox(user_id):
+    """Rejoue dans l'ordre les écritures locales en attente d'un utilisateur ; False s'il en reste
+    
+    Une écriture rejetée OUTBOX_MAX_ATTEMPTS fois (les pannes réseau ne comptent pas) est retirée
+    de la file, conservée dans outbox_dead_letters et signalée, pour ne pas bloquer les suivantes.
+    """
+    with _outbox_locks.setdefault(user_id, threading.Lock()):
+        while True:
+            pending = local_mirror.pending(user_id)
+            if not pending:
+                return True
+            for seq, operation, payload in pending:
+                try:
+                    _OUTBOX_OPERATIONS[operation](**payload)
+                except Exception as e:
+                    attempts = local_mirror.record_failure(seq, e, counted=not _is_network_error(e))
+                    if attempts < OUTBOX_MAX_ATTEMPTS:
+                        return False
+                    local_mirror.dead_letter(seq)
+                    st.error(f"❌ Écriture abandonnée après {attempts} tentatives ({operation}) : {str(e)}")
+                    continue
+                local_mirror.acknowledge(seq)
+
+def _remote_or_queued(operation, payload, apply_locally):
+    """Exécute une écriture sur Supabase, ou, miroir actif et Supabase injoignable, l'applique localement
+    et la met en file d'attente (rejouée dans l'ordre par _replay_outbox)
+    
+    Tant que des écritures plus anciennes du même utilisateur attendent, la nouvelle est mise en file
+    derrière elles. Une écriture rejetée par Supabase (hors panne réseau) lève son exception.
+    """
+    if local_mirror is None:
+        return _OUTBOX_OPERATIONS[operation](**payload)
+    
+    user_id = payload['user_id']
+    if _replay_outbox(user_id):
+        try:
+            return _OUTBOX_OPERATIONS[operation](**payload)
+        except Exception as e:
+            if not _is_network_error(e):
+                raise
+    
+    result = apply_locally()
+    local_mirror.enqueue(operation, payload, user_id)
+    _warn_queued_writes()
+    return result
+
+def _mirror_rows(rows):
+    """Recopie dans le miroir local les lignes user_emails renvoyées par Supabase"""
+    if local_mirror is not None and rows:
+        local_mirror.upsert_emails(rows)
+
+def refresh_local_mirror(user_id, force=False):
+    """Réplique les écritures locales en attente puis rattrape les lignes modifiées côté Supabase
+    
+    Le rattrapage suit un curseur (updated_at, id), repris MIRROR_CATCH_UP_OVERLAP secondes plus tôt
+    (lignes relues sans effet). Si Supabase est injoignable, les lectures continuent sur les données
+    locales et la file d'attente est conservée.
+    """
+    if local_mirror is None:
+        return False
+    
+    now = time.monotonic()
+    last_refresh = _mirror_refreshed_at.get(user_id)
+    if not force and last_refresh is not None and now - last_refresh < MIRROR_REFRESH_INTERVAL:
+        return True
+    _mirror_refreshed_at[user_id] = now
+    
+    try:
+        _replay_outbox(user_id)
+        
+        cursor = local_mirror.get_cursor(user_id)
+        overlap_start = None
+        if cursor:
+            last_updated = datetime.fromisoformat(cursor[0].replace('Z', '+00:00'))
+            overlap_start = (last_updated - timedelta(seconds=MIRROR_CATCH_UP_OVERLAP)).isoformat()
+            cursor = None
+        while True:
+            query = supabase.table('user_emails').select(', '.join(MIRROR_COLUMNS)).eq('user_id', user_id)
+            if cursor:
+                last_updated, last_id = cursor
+                query = query.or_(
+                    f'updated_at.gt."{last_updated}",and(updated_at.eq."{last_updated}",id.gt."{last_id}")'
+                )
+            elif overlap_start:
+                query = query.gte('updated_at', overlap_start)
+            result = query.order('updated_at').order('id').limit(MIRROR_CATCH_UP_PAGE_SIZE).execute()
+            rows = result.data or []
+            
+            local_mirror.upsert_emails(rows)
+            if len(rows) < MIRROR_CATCH_UP_PAGE_SIZE or not rows[-1].get('updated_at'):
+                if rows and rows[-1].get('updated_at'):
+                    local_mirror.set_cursor(user_id, (rows[-1]['updated_at'], rows[-1]['id']))
+                return True
+            cursor = (rows[-1]['updated_at'], rows[-1]['id'])
+            local_mirror.set_cursor(user_id, cursor)
+        
+    except Exception:
+        # Supabase indisponible : les lectures continuent sur le miroir local
+        return False
+
+# Nombre d'emails envoyés par requête upsert (et par recherche des lignes existantes)
+UPSERT_CHUNK_SIZE = 200
+
+def _upsert_email_records(records):
+    """Envoie un lot de lignes user_emails en un seul upsert ; renvoie {email_id: id}"""
+    if not records:
+        return {}
+    result = supabase.table('user_emails').upsert(records, on_conflict='user_id,email_id').execute()
+    _mirror_rows(result.data)
+    return {row['email_id']: row['id'] for row in result.data or []}
+
 def sync_emails_with_imap(user_id, imap_emails):
-    """Synchronise les emails IMAP avec la base de données"""
+    """Synchronise en masse les emails IMAP avec la base de données
+    
+    Par lot de UPSERT_CHUNK_SIZE emails : une recherche des lignes existantes puis un upsert
+    pour les nouvelles lignes et un pour les lignes existantes, au lieu de deux requêtes par email.
+    Renvoie {'inserted': n, 'updated': n, 'ids': {email_id: id}}, ou None en cas d'erreur.
+    """
     try:
-        synced_count = 0
+        # Un même message peut apparaître deux fois (boîte de réception et onglet) : garder l'onglet
+        records = {}
+        legacy_fields = {}
+        for email_data in imap_emails:
+            record = _build_email_record(user_id, email_data, email_data.get('email_id'))
+            email_data['email_id'] = record['email_id']
+            previous = records.get(record['email_id'])
+            if previous is None or previous['category'] == DEFAULT_CATEGORY:
+                records[record['email_id']] = record
+                legacy_fields[record['email_id']] = _legacy_fields(email_data)
+        
+        synced = _remote_or_queued(
+            'sync_email_records',
+            {'user_id': user_id, 'records': list(records.values()), 'legacy_fields': legacy_fields},
+            lambda: {'inserted': 0, 'updated': 0, 'ids': _write_email_records_locally(user_id, list(records.values()))}
+        )
         
         for email_data in imap_emails:
-            email_unique_id = email_data.get('email_id') or generate_email_id(email_data)
-            
-            saved_id = save_email_to_supabase(user_id, email_data, email_unique_id)
-            if saved_id:
-                synced_count += 1
+            email_id = email_data.get('email_id')
+            if email_id in synced['ids']:
+                email_data['db_id'] = synced['ids'][email_id]
         
-        return synced_count
+        return synced
         
     except Exception as e:
         st.error(f"Erreur lors de la synchronisation : {str(e)}")
-        return 0
\ No newline at end of file
+        return None
+
+def _sync_email_records_remote(user_id, records, legacy_fields):
+    """Upsert en masse de lignes user_emails dans Supabase (lève une exception en cas d'échec)"""
+    synced = {'inserted': 0, 'updated': 0, 'ids': {}}
+    for start in range(0, len(records), UPSERT_CHUNK_SIZE):
+        chunk = records[start:start + UPSERT_CHUNK_SIZE]
+        existing = supabase.table('user_emails').select('id, email_id, category, is_processed').eq('user_id', user_id).in_(
+            'email_id', [record['email_id'] for record in chunk]
+        ).execute()
+        existing_by_id = {row['email_id']: row for row in existing.data or []}
+        
+        # Messages stockés avant migrations/003 sous un ancien identifiant : renommés plutôt que dupliqués
+        existing_by_id.update(_rekey_legacy_rows(user_id, {
+            record['email_id']: legacy_fields[record['email_id']]
+            for record in chunk if record['email_id'] not in existing_by_id
+        }))
+        
+        new_records = []
+        existing_records = []
+        moved_rows = []
+        for record in chunk:
+            row = existing_by_id.get(record['email_id'])
+            if row is None:
+                new_records.append(record)
+                continue
+            # Ligne existante : conserver la date de création et l'état de traitement,
+            # et ne pas remplacer la catégorie d'un onglet par la boîte de réception
+            record = {key: value for key, value in record.items() if key not in ('created_at', 'is_processed')}
+            if record['category'] == DEFAULT_CATEGORY and row.get('category'):
+                record['category'] = row['category']
+            if record['category'] != row.get('category'):
+                moved_rows.append((row, dict(row, category=record['category'])))
+            existing_records.append(record)
+        
+        inserted_ids = _upsert_email_records(new_records)
+        updated_ids = _upsert_email_records(existing_records)
+        synced['inserted'] += len(inserted_ids)
+        synced['updated'] += len(updated_ids)
+        synced['ids'].update(inserted_ids)
+        synced['ids'].update(updated_ids)
+        
+        _apply_counter_changes(
+            user_id,
+            removed=[old for old, new in moved_rows],
+            added=[record for record in new_records if record['email_id'] in inserted_ids] + [new for old, new in moved_rows]
+        )
+    
+    return synced
+
+def get_mail_sync_state(user_id, folder):
+    """Récupère l'état de synchronisation IMAP d'un dossier (UIDVALIDITY, dernier UID vu)"""
+    try:
+        result = supabase.table('user_mail_sync_state').select('*').eq('user_id', user_id).eq('folder', folder).execute()
+        return result.data[0] if result.data else None
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la récupération de l'état de synchronisation : {str(e)}")
+        return None
+
+def save_mail_sync_state(user_id, folder, uidvalidity, last_uid, synced_since=None, highest_modseq=None):
+    """Enregistre l'état de synchronisation IMAP d'un dossier"""
+    try:
+        state_record = {
+            'user_id': user_id,
+            'folder': folder,
+            'uidvalidity': uidvalidity,
+            'last_uid': last_uid,
+            'synced_since': synced_since,
+            'highest_modseq': highest_modseq,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }
+        
+        result = supabase.table('user_mail_sync_state').upsert(state_record, on_conflict='user_id,folder').execute()
+        return result.data[0] if result.data else None
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la sauvegarde de l'état de synchronisation : {str(e)}")
+        return None
+
+
+# Nombre d'UIDs par requête de mise à jour en masse (limite la taille de l'URL PostgREST)
+FLAG_UPDATE_CHUNK_SIZE = 200
+
+def apply_imap_flag_changes(user_id, folder, uidvalidity, seen_uids=(), unseen_uids=(), vanished_uids=()):
+    """Répercute en masse les changements de drapeaux IMAP (\\Seen, messages disparus) sur user_emails"""
+    try:
+        payload = {
+            'user_id': user_id,
+            'folder': folder,
+            'uidvalidity': uidvalidity,
+            'seen_uids': [int(uid) for uid in seen_uids],
+            'unseen_uids': [int(uid) for uid in unseen_uids],
+            'vanished_uids': [int(uid) for uid in vanished_uids]
+        }
+        return _remote_or_queued(
+            'apply_imap_flag_changes', payload,
+            lambda: _apply_imap_flag_changes_locally(**payload)
+        )
+        
+    except Exception as e:
+        st.error(f"Erreur lors de la synchronisation des drapeaux : {str(e)}")
+        return None
+
+def _apply_imap_flag_changes_remote(user_id, folder, uidvalidity, seen_uids=(), unseen_uids=(), vanished_uids=()):
+    """Changements de drapeaux IMAP appliqués dans Supabase (lève une exception en cas d'échec)"""
+    current_time = datetime.now(timezone.utc).isoformat()
+    counts = {'seen': 0, 'unseen': 0, 'vanished': 0}
+    
+    def folder_query(query):
+        return query.eq('user_id', user_id).eq('imap_folder', folder).eq('imap_uidvalidity', uidvalidity)
+    
+    for key, uids, is_processed in (('seen', list(seen_uids), True), ('unseen', list(unseen_uids), False)):
+        for start in range(0, len(uids), FLAG_UPDATE_CHUNK_SIZE):
+            chunk = uids[start:start + FLAG_UPDATE_CHUNK_SIZE]
+            # Seules les lignes dont l'état change sont mises à jour (et comptées)
+            result = folder_query(supabase.table('user_emails').update({
+                'is_processed': is_processed,
+                'updated_at': current_time
+            })).eq('is_processed', not is_processed).in_('imap_uid', chunk).execute()
+            changed = result.data or []
+            _mirror_rows(changed)
+            counts[key] += len(changed)
+            _apply_counter_changes(
+                user_id,
+                removed=[dict(row, is_processed=not is_processed) for row in changed],
+                added=changed
+            )
+    
+    vanished = list(vanished_uids)
+    for start in range(0, len(vanished), FLAG_UPDATE_CHUNK_SIZE):
+        chunk = vanished[start:start + FLAG_UPDATE_CHUNK_SIZE]
+        result = folder_query(supabase.table('user_emails').delete()).in_('imap_uid', chunk).execute()
+        counts['vanished'] += len(result.data or [])
+        if local_mirror is not None:
+            local_mirror.delete_emails(row['id'] for row in result.data or [])
+        _apply_counter_changes(user_id, removed=result.data or [])
+    
+    return counts
+
+def _apply_imap_flag_changes_locally(user_id, folder, uidvalidity, seen_uids=(), unseen_uids=(), vanished_uids=()):
+    """Équivalent local de _apply_imap_flag_changes_remote (miroir seul, compteurs mis à jour au rejeu)"""
+    counts = {'seen': 0, 'unseen': 0, 'vanished': 0}
+    for key, uids, is_processed in (('seen', seen_uids, True), ('unseen', unseen_uids, False)):
+        for start in range(0, len(uids), FLAG_UPDATE_CHUNK_SIZE):
+            counts[key] += len(local_mirror.set_processed_by_uid(
+                user_id, folder, uidvalidity, uids[start:start + FLAG_UPDATE_CHUNK_SIZE], is_processed
+            ))
+    for start in range(0, len(vanished_uids), FLAG_UPDATE_CHUNK_SIZE):
+        counts['vanished'] += len(local_mirror.delete_by_uid(
+            user_id, folder, uidvalidity, vanished_uids[start:start + FLAG_UPDATE_CHUNK_SIZE]
+        ))
+    return counts
+
+# Écritures rejouées sur Supabase, par nom d'opération de la file d'attente du miroir local
+_OUTBOX_OPERATIONS = {
+    'mark_email_as_processed': _mark_email_as_processed_remote,
+    'save_email_record': _save_email_record_remote,
+    'sync_email_records': _sync_email_records_remote,
+    'apply_imap_flag_changes': _apply_imap_flag_changes_remote
+}
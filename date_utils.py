@@ -0,0 +1,78 @@
+import email.utils
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Formats de repli pour les dates que parsedate_to_datetime ne reconnaît pas
+DATE_FORMATS = [
+    "%a, %d %b %Y %H:%M:%S %z",
+    "%d %b %Y %H:%M:%S %z",
+    "%a, %d %b %Y %H:%M:%S %Z",
+    "%d %b %Y %H:%M:%S %Z",
+    "%a, %d %b %Y %H:%M:%S",
+    "%d %b %Y %H:%M:%S"
+]
+
+def _as_utc(parsed):
+    """Ramène une date en UTC (une date naïve est supposée déjà en UTC)"""
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+@lru_cache(maxsize=16384)
+def _parse_date_cached(date_str):
+    """Parse une date RFC 2822 (ou ISO 8601 pour les dates stockées en base) ; None si illisible"""
+    try:
+        return _as_utc(email.utils.parsedate_to_datetime(date_str))
+    except (TypeError, ValueError, IndexError):
+        pass
+
+    # Dates relues depuis Supabase (date_received au format ISO)
+    try:
+        return _as_utc(datetime.fromisoformat(date_str.replace("Z", "+00:00")))
+    except ValueError:
+        pass
+
+    for fmt in DATE_FORMATS:
+        try:
+            return _as_utc(datetime.strptime(date_str, fmt))
+        except ValueError:
+            continue
+    return None
+
+def parse_email_date(date_str):
+    """Parse une date d'email en objet datetime avec gestion complète des timezones"""
+    if isinstance(date_str, datetime):
+        return _as_utc(date_str)
+    if not date_str or not isinstance(date_str, str) or not date_str.strip():
+        return datetime.now(timezone.utc)
+
+    parsed = _parse_date_cached(date_str.strip())
+    return parsed if parsed is not None else datetime.now(timezone.utc)
+
+def parse_email_dates(date_strings):
+    """Parse une liste de dates d'email ; chaque valeur distincte n'est analysée qu'une fois"""
+    return [parse_email_date(date_str) for date_str in date_strings]
+
+def annotate_email_dates(emails):
+    """Ajoute à chaque email sa date analysée (date_parsed, UTC) et son horodatage epoch (timestamp)"""
+    pending = [email_data for email_data in emails if email_data.get("timestamp") is None]
+    for email_data, parsed in zip(pending, parse_email_dates([email_data.get("date", "") for email_data in pending])):
+        email_data["date_parsed"] = parsed
+        email_data["timestamp"] = parsed.timestamp()
+    return emails
+
+def to_display_time(parsed):
+    """Convertit une date (UTC) dans le fuseau local, celui de date.today(), avant affichage"""
+    return _as_utc(parsed).astimezone()
+
+def email_timestamp(email_data):
+    """Clé de tri d'un email : horodatage epoch calculé à l'ingestion, sans nouvelle analyse"""
+    timestamp = email_data.get("timestamp")
+    if timestamp is None:
+        timestamp = parse_email_date(email_data.get("date", "")).timestamp()
+    return timestamp
+
+def sort_emails_by_date(emails, reverse=True):
+    """Trie des emails par date (du plus récent au plus ancien par défaut)"""
+    emails.sort(key=email_timestamp, reverse=reverse)
+    return emails
@@ -0,0 +1,230 @@
+import imaplib
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Gmail autorise 15 connexions IMAP simultanées par compte : on en laisse
+# quelques-unes aux autres clients (téléphone, webmail...)
+MAX_CONNECTIONS_PER_USER = 10
+
+# Nombre maximal de sessions ouvertes par le processus, tous utilisateurs confondus
+MAX_TOTAL_CONNECTIONS = 100
+
+# Une session inutilisée depuis plus longtemps est fermée
+IDLE_TIMEOUT = 600
+
+# Une session inutilisée depuis plus longtemps est vérifiée par un NOOP avant réutilisation
+KEEPALIVE_INTERVAL = 60
+
+# Délai maximal d'attente d'une connexion libre
+ACQUIRE_TIMEOUT = 30
+
+# Extensions activées à la connexion, par ordre de préférence (ENABLE n'est accepté qu'avant SELECT)
+ENABLE_EXTENSIONS = ("QRESYNC", "CONDSTORE")
+
+class _PooledSession:
+    """Session IMAP authentifiée et son état dans le pool"""
+
+    def __init__(self, mail, username, password_hash):
+        self.mail = mail
+        self.username = username
+        self.password_hash = password_hash
+        self.last_used = time.monotonic()
+
+class IMAPConnectionPool:
+    """Pool de sessions IMAP authentifiées, partagé par tout le processus et indexé par utilisateur"""
+
+    def __init__(self, host, max_per_user=MAX_CONNECTIONS_PER_USER, max_total=MAX_TOTAL_CONNECTIONS,
+                 idle_timeout=IDLE_TIMEOUT, keepalive_interval=KEEPALIVE_INTERVAL):
+        self.host = host
+        self.max_per_user = max_per_user
+        self.max_total = max_total
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+
+        self._condition = threading.Condition()
+        # Sessions libres, de la moins récemment utilisée à la plus récente (LRU)
+        self._idle = OrderedDict()
+        # Nombre de sessions ouvertes (libres ou empruntées) par utilisateur
+        self._open_counts = {}
+
+    @staticmethod
+    def _hash_password(password):
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    def _total_open(self):
+        return sum(self._open_counts.values())
+
+    def _forget(self, session):
+        """Retire une session du décompte (à appeler sous verrou)"""
+        count = self._open_counts.get(session.username, 0) - 1
+        if count > 0:
+            self._open_counts[session.username] = count
+        else:
+            self._open_counts.pop(session.username, None)
+        self._condition.notify_all()
+
+    def _evict(self, key):
+        """Retire une session libre du pool et renvoie la session à fermer (à appeler sous verrou)"""
+        session = self._idle.pop(key)
+        self._forget(session)
+        return session
+
+    def _evict_expired(self):
+        """Retire les sessions libres inactives depuis trop longtemps (à appeler sous verrou)"""
+        now = time.monotonic()
+        expired = [key for key, session in self._idle.items() if now - session.last_used > self.idle_timeout]
+        return [self._evict(key) for key in expired]
+
+    @staticmethod
+    def _close(sessions):
+        """Ferme des sessions hors verrou, en ignorant les erreurs réseau"""
+        for session in sessions:
+            try:
+                session.mail.logout()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _refresh_capabilities(mail):
+        """Relit CAPABILITY après LOGIN : imaplib garde la liste d'avant authentification (sans ENABLE ni CONDSTORE chez Gmail)"""
+        status, data = mail.capability()
+        if status == "OK" and data and data[-1]:
+            mail.capabilities = tuple(data[-1].decode().upper().split())
+
+    @staticmethod
+    def _enable_extensions(mail):
+        """Active QRESYNC (ou à défaut CONDSTORE) tant que la session est dans l'état AUTH ; mémorise l'extension activée"""
+        mail.enabled_extension = ""
+        if "ENABLE" not in mail.capabilities:
+            return
+        for extension in ENABLE_EXTENSIONS:
+            if extension not in mail.capabilities:
+                continue
+            try:
+                status, _ = mail.enable(extension)
+            except imaplib.IMAP4.abort:
+                raise
+            except imaplib.IMAP4.error:
+                continue
+            if status == "OK":
+                mail.enabled_extension = extension
+                return
+
+    def _connect(self, username, password, password_hash):
+        mail = imaplib.IMAP4_SSL(self.host)
+        try:
+            mail.login(username, password)
+            self._refresh_capabilities(mail)
+            self._enable_extensions(mail)
+        except Exception:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+            raise
+        return _PooledSession(mail, username, password_hash)
+
+    def acquire(self, username, password, timeout=ACQUIRE_TIMEOUT):
+        """Emprunte une session authentifiée pour l'utilisateur (réutilisée ou nouvelle)"""
+        password_hash = self._hash_password(password)
+        deadline = time.monotonic() + timeout
+        session = None
+
+        with self._condition:
+            while True:
+                to_close = self._evict_expired()
+                reserved = False
+
+                # Réutiliser la session libre la plus récente de cet utilisateur
+                user_keys = [key for key, idle in self._idle.items() if idle.username == username]
+                for key in reversed(user_keys):
+                    if self._idle[key].password_hash == password_hash:
+                        session = self._idle.pop(key)
+                        break
+                    # Identifiants modifiés : l'ancienne session n'est plus utilisable
+                    to_close.append(self._evict(key))
+
+                if session is None:
+                    # Plafond global atteint : fermer la session libre la moins récemment utilisée
+                    if self._total_open() >= self.max_total and self._idle:
+                        to_close.append(self._evict(next(iter(self._idle))))
+
+                    if (self._open_counts.get(username, 0) < self.max_per_user
+                            and self._total_open() < self.max_total):
+                        # Réserver la place avant de se connecter hors verrou
+                        self._open_counts[username] = self._open_counts.get(username, 0) + 1
+                        reserved = True
+
+                if to_close:
+                    self._condition.release()
+                    try:
+                        self._close(to_close)
+                    finally:
+                        self._condition.acquire()
+
+                if session is not None or reserved:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Aucune connexion IMAP disponible pour {username}")
+                self._condition.wait(remaining)
+
+        if session is None:
+            try:
+                return self._connect(username, password, password_hash)
+            except Exception:
+                with self._condition:
+                    self._forget(_PooledSession(None, username, password_hash))
+                raise
+
+        # Vérifier par un NOOP qu'une session restée inactive est toujours vivante
+        if time.monotonic() - session.last_used > self.keepalive_interval:
+            try:
+                session.mail.noop()
+            except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError):
+                self._close([session])
+                try:
+                    session = self._connect(username, password, password_hash)
+                except Exception:
+                    with self._condition:
+                        self._forget(session)
+                    raise
+
+        return session
+
+    def release(self, session, discard=False):
+        """Rend une session au pool, ou la ferme si elle n'est plus utilisable"""
+        if discard:
+            with self._condition:
+                self._forget(session)
+            self._close([session])
+            return
+
+        session.last_used = time.monotonic()
+        with self._condition:
+            self._idle[id(session)] = session
+            self._condition.notify_all()
+
+    @contextmanager
+    def connection(self, username, password):
+        """Fournit une session IMAP empruntée au pool, rendue automatiquement en sortie"""
+        session = self.acquire(username, password)
+        discard = False
+        try:
+            yield session.mail
+        except (imaplib.IMAP4.abort, OSError):
+            # Connexion coupée : elle ne doit pas être réutilisée
+            discard = True
+            raise
+        finally:
+            self.release(session, discard=discard)
+
+    def close_all(self):
+        """Ferme toutes les sessions libres du pool"""
+        with self._condition:
+            to_close = [self._evict(key) for key in list(self._idle)]
+        self._close(to_close)
@@ -0,0 +1,380 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+# Colonnes de user_emails conservées localement
+MIRROR_COLUMNS = (
+    'id', 'user_id', 'email_id', 'sender', 'recipient', 'subject', 'body', 'snippet',
+    'date_received', 'category', 'is_processed', 'imap_folder', 'imap_uid', 'imap_uidvalidity',
+    'created_at', 'updated_at'
+)
+
+_SCHEMA = """
+create table if not exists user_emails (
+    id text primary key,
+    user_id text not null,
+    email_id text,
+    sender text,
+    recipient text,
+    subject text,
+    body text,
+    snippet text,
+    date_received text,
+    category text,
+    is_processed integer default 0,
+    imap_folder text,
+    imap_uid integer,
+    imap_uidvalidity integer,
+    created_at text,
+    updated_at text
+);
+create index if not exists user_emails_user_category_date_idx
+    on user_emails (user_id, category, date_received desc, id desc);
+create index if not exists user_emails_user_date_idx
+    on user_emails (user_id, date_received desc, id desc);
+
+create table if not exists outbox (
+    seq integer primary key autoincrement,
+    operation text not null,
+    payload text not null,
+    attempts integer not null default 0,
+    last_error text,
+    created_at text not null
+);
+
+create table if not exists outbox_dead_letters (
+    seq integer primary key,
+    user_id text,
+    operation text not null,
+    payload text not null,
+    attempts integer not null,
+    last_error text,
+    created_at text not null,
+    failed_at text not null
+);
+
+create table if not exists sync_cursors (
+    user_id text primary key,
+    updated_at text,
+    last_id text
+);
+"""
+
+# Index plein texte FTS5 (contenu externe : user_emails), tenu à jour par déclencheurs
+_FTS_SCHEMA = """
+create virtual table user_emails_fts using fts5(
+    subject, sender, body,
+    content='user_emails', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+create trigger user_emails_fts_insert after insert on user_emails begin
+    insert into user_emails_fts (rowid, subject, sender, body)
+    values (new.rowid, new.subject, new.sender, new.body);
+end;
+create trigger user_emails_fts_delete after delete on user_emails begin
+    insert into user_emails_fts (user_emails_fts, rowid, subject, sender, body)
+    values ('delete', old.rowid, old.subject, old.sender, old.body);
+end;
+create trigger user_emails_fts_update after update of subject, sender, body on user_emails begin
+    insert into user_emails_fts (user_emails_fts, rowid, subject, sender, body)
+    values ('delete', old.rowid, old.subject, old.sender, old.body);
+    insert into user_emails_fts (rowid, subject, sender, body)
+    values (new.rowid, new.subject, new.sender, new.body);
+end;
+insert into user_emails_fts (user_emails_fts) values ('rebuild');
+"""
+
+# Préfixe des lignes créées localement pendant une panne de Supabase, en attendant leur id définitif
+LOCAL_ID_PREFIX = 'local:'
+
+def local_email_id(user_id, email_id):
+    """Id provisoire d'une ligne créée localement : local:<user_id>:<email_id>"""
+    return f"{LOCAL_ID_PREFIX}{user_id}:{email_id}"
+
+def parse_local_email_id(row_id):
+    """(user_id, email_id) d'un id provisoire, None pour un id Supabase"""
+    if not isinstance(row_id, str) or not row_id.startswith(LOCAL_ID_PREFIX):
+        return None
+    user_id, _, email_id = row_id[len(LOCAL_ID_PREFIX):].partition(':')
+    return user_id, email_id
+
+# Poids bm25 des colonnes indexées (sujet, expéditeur, corps)
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+def _fts_query(text):
+    """Convertit une saisie libre en requête FTS5 (chaque mot entre guillemets, recherche par préfixe)"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+class LocalMirror:
+    """Miroir SQLite (mode WAL) de user_emails : lectures locales, file d'écritures à répliquer"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # Une seule connexion partagée par les sessions Streamlit, protégée par un verrou
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.executescript(_SCHEMA)
+        self._ensure_outbox_user_id()
+        self.has_fts = self._ensure_fts()
+
+    def _ensure_outbox_user_id(self):
+        """Ajoute outbox.user_id (file rejouée par utilisateur) aux miroirs créés avant cette colonne"""
+        columns = {row['name'] for row in self._conn.execute("pragma table_info(outbox)").fetchall()}
+        if 'user_id' in columns:
+            return
+        with self._conn:
+            self._conn.execute("alter table outbox add column user_id text")
+            self._conn.execute("create index if not exists outbox_user_seq_idx on outbox (user_id, seq)")
+            # Seules les mises à jour « traité » existaient : retrouver l'utilisateur par la ligne locale
+            self._conn.execute(
+                "update outbox set user_id = (select e.user_id from user_emails e "
+                "where e.id = json_extract(outbox.payload, '$.email_id')) where user_id is null"
+            )
+
+    def _ensure_fts(self):
+        """Crée l'index FTS5 au premier lancement (et indexe les lignes existantes) ; False si FTS5 est absent"""
+        exists = self._conn.execute(
+            "select 1 from sqlite_master where type = 'table' and name = 'user_emails_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            with self._conn:
+                self._conn.executescript(_FTS_SCHEMA)
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _row_values(row):
+        values = {column: row.get(column) for column in MIRROR_COLUMNS}
+        # Valeur absente (ligne partielle) : conserver la valeur locale
+        if values['is_processed'] is not None:
+            values['is_processed'] = 1 if values['is_processed'] else 0
+        return values
+
+    @staticmethod
+    def _to_row(row):
+        row['is_processed'] = bool(row.get('is_processed'))
+        return row
+
+    def upsert_emails(self, rows):
+        """Enregistre ou remplace des lignes user_emails reçues de Supabase"""
+        rows = [self._row_values(row) for row in rows if row.get('id')]
+        if not rows:
+            return 0
+        placeholders = ', '.join('?' for _ in MIRROR_COLUMNS)
+        updates = ', '.join(f"{column} = coalesce(excluded.{column}, {column})" for column in MIRROR_COLUMNS if column != 'id')
+        with self._lock, self._conn:
+            # Ligne provisoire (créée pendant une panne) remplacée par la ligne Supabase du même email
+            self._conn.executemany(
+                "delete from user_emails where user_id = ? and email_id = ? and id <> ? and id like ?",
+                [(row['user_id'], row['email_id'], row['id'], LOCAL_ID_PREFIX + '%') for row in rows if row['email_id']]
+            )
+            self._conn.executemany(
+                f"insert into user_emails ({', '.join(MIRROR_COLUMNS)}) values ({placeholders}) "
+                f"on conflict (id) do update set {updates}",
+                [tuple(row[column] for column in MIRROR_COLUMNS) for row in rows]
+            )
+        return len(rows)
+
+    def delete_emails(self, ids):
+        """Supprime des lignes disparues côté serveur"""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("delete from user_emails where id = ?", [(email_id,) for email_id in ids])
+
+    def find_emails(self, user_id, email_ids):
+        """Lignes locales (id, email_id, category, is_processed) des email_id donnés"""
+        email_ids = list(email_ids)
+        if not email_ids:
+            return []
+        rows = self._query(
+            f"select id, email_id, category, is_processed from user_emails "
+            f"where user_id = ? and email_id in ({', '.join('?' for _ in email_ids)})",
+            (user_id, *email_ids)
+        )
+        return [self._to_row(row) for row in rows]
+
+    def set_processed_by_uid(self, user_id, folder, uidvalidity, uids, is_processed):
+        """Change l'état lu des lignes d'un dossier IMAP par UID ; renvoie les lignes modifiées"""
+        uids = list(uids)
+        if not uids:
+            return []
+        conditions = (
+            f"user_id = ? and imap_folder = ? and imap_uidvalidity = ? and is_processed = ? "
+            f"and imap_uid in ({', '.join('?' for _ in uids)})"
+        )
+        params = (user_id, folder, uidvalidity, 0 if is_processed else 1, *uids)
+        with self._lock, self._conn:
+            changed = [dict(row) for row in self._conn.execute(
+                f"select id, category, is_processed from user_emails where {conditions}", params
+            ).fetchall()]
+            self._conn.execute(
+                f"update user_emails set is_processed = ?, updated_at = ? where {conditions}",
+                (1 if is_processed else 0, datetime.now(timezone.utc).isoformat(), *params)
+            )
+        return [dict(row, is_processed=is_processed) for row in changed]
+
+    def delete_by_uid(self, user_id, folder, uidvalidity, uids):
+        """Supprime les lignes d'un dossier IMAP par UID ; renvoie les lignes supprimées"""
+        uids = list(uids)
+        if not uids:
+            return []
+        conditions = (
+            f"user_id = ? and imap_folder = ? and imap_uidvalidity = ? "
+            f"and imap_uid in ({', '.join('?' for _ in uids)})"
+        )
+        params = (user_id, folder, uidvalidity, *uids)
+        with self._lock, self._conn:
+            deleted = [dict(row) for row in self._conn.execute(
+                f"select id, category, is_processed from user_emails where {conditions}", params
+            ).fetchall()]
+            self._conn.execute(f"delete from user_emails where {conditions}", params)
+        return [self._to_row(row) for row in deleted]
+
+    def update_email(self, email_id, **fields):
+        """Modifie localement une ligne et renvoie la ligne à jour (None si absente)"""
+        fields['updated_at'] = datetime.now(timezone.utc).isoformat()
+        if 'is_processed' in fields:
+            fields['is_processed'] = 1 if fields['is_processed'] else 0
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"update user_emails set {assignments} where id = ?", (*fields.values(), email_id))
+        rows = self._query("select * from user_emails where id = ?", (email_id,))
+        return self._to_row(rows[0]) if rows else None
+
+    def list_emails_page(self, user_id, columns, category=None, since=None, page_size=50, cursor=None):
+        """Page d'emails triés par (date_received, id) décroissants, après le curseur donné"""
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        if since:
+            conditions.append("date_received >= ?")
+            params.append(since)
+        if cursor:
+            conditions.append("(date_received < ? or (date_received = ? and id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        params.append(page_size)
+        rows = self._query(
+            f"select {columns} from user_emails where {' and '.join(conditions)} "
+            "order by date_received desc, id desc limit ?",
+            params
+        )
+        return [self._to_row(row) for row in rows]
+
+    def list_emails_by_category(self, user_id, columns, since=None, categories=None, limit_per_category=50):
+        """N emails les plus récents de chaque catégorie (fenêtre row_number, comme la fonction SQL distante)"""
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if since:
+            conditions.append("date_received >= ?")
+            params.append(since)
+        if categories:
+            conditions.append(f"category in ({', '.join('?' for _ in categories)})")
+            params.extend(categories)
+        params.append(limit_per_category)
+        rows = self._query(
+            f"select {columns} from ("
+            f"select *, row_number() over (partition by category order by date_received desc, id desc) as category_rank "
+            f"from user_emails where {' and '.join(conditions)}"
+            ") where category_rank <= ? order by date_received desc, id desc",
+            params
+        )
+        return [self._to_row(row) for row in rows]
+
+    def search_emails(self, user_id, columns, text, category=None, since=None, limit=50,
+                      highlight_start='\x02', highlight_end='\x03'):
+        """Recherche plein texte (FTS5) classée par bm25, avec extrait surligné"""
+        query = _fts_query(text)
+        if not query:
+            return []
+        conditions = ["user_emails_fts match ?", "e.user_id = ?"]
+        params = [highlight_start, highlight_end, *FTS_WEIGHTS, query, user_id]
+        if category:
+            conditions.append("e.category = ?")
+            params.append(category)
+        if since:
+            conditions.append("e.date_received >= ?")
+            params.append(since)
+        params.append(limit)
+        select_columns = ', '.join(f"e.{column.strip()}" for column in columns.split(','))
+        rows = self._query(
+            f"select {select_columns}, "
+            "snippet(user_emails_fts, 2, ?, ?, '…', 24) as highlight, "
+            "-bm25(user_emails_fts, ?, ?, ?) as rank "
+            "from user_emails_fts join user_emails e on e.rowid = user_emails_fts.rowid "
+            f"where {' and '.join(conditions)} "
+            "order by rank desc, e.date_received desc limit ?",
+            params
+        )
+        return [self._to_row(row) for row in rows]
+
+    def get_email_body(self, user_id, email_id):
+        rows = self._query("select body from user_emails where user_id = ? and id = ?", (user_id, email_id))
+        return (rows[0]['body'] or '') if rows else None
+
+    def enqueue(self, operation, payload, user_id):
+        """Ajoute une écriture à répliquer vers Supabase (file durable, dans l'ordre)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "insert into outbox (user_id, operation, payload, created_at) values (?, ?, ?, ?)",
+                (user_id, operation, json.dumps(payload), datetime.now(timezone.utc).isoformat())
+            )
+
+    def pending(self, user_id, limit=100):
+        """Écritures en attente d'un utilisateur, de la plus ancienne à la plus récente"""
+        rows = self._query(
+            "select seq, operation, payload from outbox where user_id is ? order by seq limit ?", (user_id, limit)
+        )
+        return [(row['seq'], row['operation'], json.loads(row['payload'])) for row in rows]
+
+    def acknowledge(self, seq):
+        with self._lock, self._conn:
+            self._conn.execute("delete from outbox where seq = ?", (seq,))
+
+    def record_failure(self, seq, error, counted=True):
+        """Note l'échec d'un rejeu ; renvoie le nombre de tentatives comptées (hors pannes réseau)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "update outbox set attempts = attempts + ?, last_error = ? where seq = ?",
+                (1 if counted else 0, str(error)[:500], seq)
+            )
+            row = self._conn.execute("select attempts from outbox where seq = ?", (seq,)).fetchone()
+        return row['attempts'] if row else 0
+
+    def dead_letter(self, seq):
+        """Retire de la file une écriture rejetée trop souvent et la conserve dans outbox_dead_letters"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "insert or replace into outbox_dead_letters "
+                "(seq, user_id, operation, payload, attempts, last_error, created_at, failed_at) "
+                "select seq, user_id, operation, payload, attempts, last_error, created_at, ? from outbox where seq = ?",
+                (datetime.now(timezone.utc).isoformat(), seq)
+            )
+            self._conn.execute("delete from outbox where seq = ?", (seq,))
+
+    def get_cursor(self, user_id):
+        """Dernier (updated_at, id) reçu de Supabase pour cet utilisateur"""
+        rows = self._query("select updated_at, last_id from sync_cursors where user_id = ?", (user_id,))
+        return (rows[0]['updated_at'], rows[0]['last_id']) if rows and rows[0]['updated_at'] else None
+
+    def set_cursor(self, user_id, cursor):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "insert into sync_cursors (user_id, updated_at, last_id) values (?, ?, ?) "
+                "on conflict (user_id) do update set updated_at = excluded.updated_at, last_id = excluded.last_id",
+                (user_id, cursor[0], cursor[1])
+            )
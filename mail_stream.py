@@ -0,0 +1,223 @@
+import base64
+import binascii
+import quopri
+from email.parser import BytesHeaderParser
+
+# Taille maximale conservée en mémoire pour l'ensemble des parties texte d'un message
+MAX_TEXT_SIZE = 1024 * 1024
+
+# Au-delà, les en-têtes d'une partie sont ignorés (protection contre les messages malformés)
+MAX_HEADER_SIZE = 256 * 1024
+
+# Une ligne plus longue (binaire sans fin de ligne) est analysée par morceaux pour borner le tampon
+MAX_LINE_SIZE = 64 * 1024
+
+_header_parser = BytesHeaderParser()
+
+class _Base64Stream:
+    """Décodeur base64 incrémental, ligne par ligne"""
+
+    def __init__(self):
+        self._carry = b""
+
+    def decode(self, line):
+        data = self._carry + b"".join(line.split())
+        usable = len(data) - len(data) % 4
+        self._carry = data[usable:]
+        try:
+            return base64.b64decode(data[:usable])
+        except (binascii.Error, ValueError):
+            return b""
+
+    def flush(self):
+        carry, self._carry = self._carry, b""
+        try:
+            return base64.b64decode(carry + b"=" * (-len(carry) % 4)) if carry else b""
+        except (binascii.Error, ValueError):
+            return b""
+
+class _Part:
+    """Partie feuille en cours de lecture : texte gardé en mémoire, pièce jointe seulement mesurée"""
+
+    def __init__(self, headers, is_attachment):
+        self.headers = headers
+        self.content_type = headers.get_content_type()
+        self.charset = headers.get_content_charset() or "utf-8"
+        self.encoding = (headers.get("Content-Transfer-Encoding") or "7bit").strip().lower()
+        self.filename = headers.get_filename()
+        self.is_attachment = is_attachment
+        self.size = 0
+        self.chunks = []
+        self.truncated = False
+        self._base64 = _Base64Stream() if self.encoding == "base64" else None
+
+    def _decode(self, line):
+        if self._base64:
+            return self._base64.decode(line)
+        if self.encoding == "quoted-printable":
+            return quopri.decodestring(line)
+        return line
+
+    def _write(self, data, text_budget):
+        """Écrit des octets décodés ; renvoie le nombre d'octets gardés en mémoire"""
+        if not data:
+            return 0
+        self.size += len(data)
+        if self.is_attachment:
+            return 0
+        kept = data[:max(text_budget, 0)]
+        if kept:
+            self.chunks.append(kept)
+        if len(kept) < len(data):
+            self.truncated = True
+        return len(kept)
+
+    def feed(self, line, text_budget):
+        return self._write(self._decode(line), text_budget)
+
+    def close(self, text_budget):
+        return self._write(self._base64.flush(), text_budget) if self._base64 else 0
+
+    def text(self):
+        payload = b"".join(self.chunks)
+        try:
+            return payload.decode(self.charset, errors='ignore')
+        except LookupError:
+            return payload.decode('utf-8', errors='ignore')
+
+class StreamingMessageParser:
+    """Analyse un message RFC822 reçu par morceaux sans jamais le conserver en entier
+
+    Seules les parties texte (dans la limite de text_limit octets) restent en mémoire.
+    Le contenu des pièces jointes est seulement mesuré puis abandonné.
+    """
+
+    def __init__(self, text_limit=MAX_TEXT_SIZE):
+        self.text_limit = text_limit
+        self.headers = None
+        self.parts = []
+        self._buffer = b""
+        self._boundaries = []
+        self._state = "headers"
+        self._header_lines = []
+        self._header_size = 0
+        self._part = None
+        self._text_size = 0
+
+    def feed(self, chunk):
+        """Ajoute un morceau du message brut ; seules les lignes complètes sont analysées"""
+        self._buffer += chunk
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end == -1:
+                break
+            self._line(self._buffer[start:end + 1])
+            start = end + 1
+        self._buffer = self._buffer[start:]
+        if len(self._buffer) > MAX_LINE_SIZE and self._state == "body":
+            self._line(self._buffer)
+            self._buffer = b""
+
+    def close(self):
+        """Termine l'analyse et renvoie les en-têtes, le texte retenu et les pièces jointes"""
+        if self._buffer:
+            self._line(self._buffer)
+            self._buffer = b""
+        if self._state == "headers" and self._header_lines:
+            self._end_headers()
+        self._end_part()
+
+        text_parts = [part for part in self.parts if not part.is_attachment]
+        text_part = (
+            next((part for part in text_parts if part.content_type == "text/plain"), None)
+            or next((part for part in text_parts if part.content_type == "text/html"), None)
+        )
+        return {
+            "headers": self.headers if self.headers is not None else _header_parser.parsebytes(b""),
+            "text": text_part.text() if text_part else "",
+            "text_type": text_part.content_type if text_part else None,
+            "attachments": [
+                {
+                    "filename": part.filename or "sans nom",
+                    "size": part.size,
+                    "content_type": part.content_type
+                }
+                for part in self.parts if part.is_attachment
+            ],
+            "truncated": bool(text_part and text_part.truncated)
+        }
+
+    def _line(self, line):
+        if self._state == "headers":
+            if line.strip():
+                self._header_size += len(line)
+                if self._header_size <= MAX_HEADER_SIZE:
+                    self._header_lines.append(line)
+                return
+            self._end_headers()
+            return
+
+        boundary_match = self._match_boundary(line)
+        if boundary_match is not None:
+            depth, closing = boundary_match
+            self._end_part()
+            # Une frontière englobante ferme aussi les multiparts imbriqués restés ouverts
+            del self._boundaries[depth + 1:]
+            if closing:
+                self._boundaries.pop()
+                self._state = "preamble"
+            else:
+                self._state = "headers"
+            return
+
+        if self._state == "body" and self._part is not None:
+            self._text_size += self._part.feed(line, self.text_limit - self._text_size)
+
+    def _match_boundary(self, line):
+        """Renvoie (profondeur, fermante) si la ligne est une frontière MIME connue"""
+        if not line.startswith(b"--") or not self._boundaries:
+            return None
+        marker = line.rstrip()
+        for depth in range(len(self._boundaries) - 1, -1, -1):
+            boundary = b"--" + self._boundaries[depth]
+            if marker == boundary:
+                return depth, False
+            if marker == boundary + b"--":
+                return depth, True
+        return None
+
+    def _end_headers(self):
+        headers = _header_parser.parsebytes(b"".join(self._header_lines))
+        self._header_lines = []
+        self._header_size = 0
+        if self.headers is None:
+            self.headers = headers
+
+        if headers.get_content_maintype() == "multipart" and headers.get_boundary():
+            self._boundaries.append(headers.get_boundary().encode("utf-8", errors="ignore"))
+            self._state = "preamble"
+            return
+
+        # Les messages joints (message/rfc822) sont traités comme des pièces jointes
+        disposition = (headers.get_content_disposition() or "").lower()
+        is_attachment = (
+            disposition == "attachment"
+            or bool(headers.get_filename())
+            or headers.get_content_maintype() != "text"
+        )
+        self._part = _Part(headers, is_attachment)
+        self._state = "body"
+
+    def _end_part(self):
+        if self._part is not None:
+            self._text_size += self._part.close(self.text_limit - self._text_size)
+            self.parts.append(self._part)
+            self._part = None
+
+def parse_message_stream(chunks, text_limit=MAX_TEXT_SIZE):
+    """Analyse un message fourni sous forme d'itérable de morceaux d'octets"""
+    parser = StreamingMessageParser(text_limit)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
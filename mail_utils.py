@@ -1,48 +1,88 @@
 import imaplib
-import email
+import quopri
+import re
+import base64
+import binascii
 import smtplib
-from email.header import decode_header
+import threading
+import time
+import heapq
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timezone
 import streamlit as st
-import email.utils
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from imap_pool import IMAPConnectionPool, MAX_CONNECTIONS_PER_USER
+from mail_stream import MAX_TEXT_SIZE, parse_message_stream
+from date_utils import parse_email_date, annotate_email_dates, sort_emails_by_date, email_timestamp
 
-def parse_email_date(date_str):
-    """Parse une date d'email en objet datetime avec gestion complète des timezones"""
-    try:
-        if not date_str or date_str.strip() == "":
-            return datetime.now(timezone.utc)
-            
-        try:
-            parsed_date = email.utils.parsedate_to_datetime(date_str)
-            if parsed_date.tzinfo is None:
-                parsed_date = parsed_date.replace(tzinfo=timezone.utc)
-            return parsed_date
-        except:
-            pass
-        
-        formats = [
-            "%a, %d %b %Y %H:%M:%S %z",
-            "%d %b %Y %H:%M:%S %z",
-            "%a, %d %b %Y %H:%M:%S %Z",
-            "%d %b %Y %H:%M:%S %Z",
-            "%a, %d %b %Y %H:%M:%S",
-            "%d %b %Y %H:%M:%S"
-        ]
-        
-        for fmt in formats:
-            try:
-                parsed = datetime.strptime(date_str, fmt)
-                if parsed.tzinfo is None:
-                    parsed = parsed.replace(tzinfo=timezone.utc)
-                return parsed
-            except ValueError:
-                continue
-        
-        return datetime.now(timezone.utc)
-    except Exception:
-        return datetime.now(timezone.utc)
+# Configuration IMAP
+IMAP_SERVER = "imap.gmail.com"
+
+# Pool de sessions IMAP partagé par toutes les sessions Streamlit du processus
+imap_pool = IMAPConnectionPool(IMAP_SERVER)
+
+# Nombre de messages demandés par commande UID FETCH
+IMAP_FETCH_BATCH_SIZE = 25
+
+# Nombre de dossiers récupérés simultanément (chacun occupe une connexion IMAP)
+MAX_PARALLEL_FOLDERS = min(5, MAX_CONNECTIONS_PER_USER)
+
+# Au-delà de ce nombre de messages, le filtre de date est résolu par dichotomie sur INTERNALDATE
+# plutôt que par un SEARCH SINCE qui renvoie tous les identifiants correspondants
+INTERNALDATE_SEARCH_THRESHOLD = 5000
+
+# Longueur de l'aperçu affiché dans la liste des emails
+SNIPPET_LENGTH = 150
+
+# Octets lus au début de la partie texte pour construire l'aperçu
+SNIPPET_FETCH_SIZE = 512
+
+# Éléments demandés en mode liste : drapeaux, taille, structure MIME, en-têtes et début de la première partie
+# (la BODYSTRUCTURE donne l'encodage et le jeu de caractères de l'aperçu, ou une autre section à lire)
+HEADERS_FETCH_ITEMS = f"(FLAGS RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT DATE MESSAGE-ID)] BODY.PEEK[1]<0.{SNIPPET_FETCH_SIZE}>)"
+
+# Taille des morceaux BODY.PEEK[]<début.taille> : imaplib ne garde en mémoire qu'un morceau à la fois
+MESSAGE_CHUNK_SIZE = 512 * 1024
+
+# Structure MIME et en-têtes : seules les parties texte sont ensuite téléchargées, jamais les pièces jointes.
+# Sans BODYSTRUCTURE dans la réponse, le message est lu par morceaux (_stream_message), RFC822.SIZE
+# indiquant s'il dépasse MAX_MESSAGE_SIZE
+STRUCTURE_FETCH_ITEMS = "(FLAGS RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])"
+
+# Attributs Gmail (X-GM-EXT-1) demandés en plus lors du passage unique sur "Tous les messages"
+GMAIL_FETCH_ITEMS = "X-GM-MSGID X-GM-THRID X-GM-LABELS"
+
+# Critères de recherche Gmail équivalents à chaque dossier de catégorie.
+# Les onglets ne figurent pas dans X-GM-LABELS : ils sont obtenus par X-GM-RAW (réponse limitée aux UIDs)
+GMAIL_CATEGORY_SEARCHES = {
+    "INBOX": 'X-GM-LABELS "\\\\Inbox"',
+    "[Gmail]/Category Promotions": 'X-GM-RAW "category:promotions"',
+    "[Gmail]/Category Social": 'X-GM-RAW "category:social"',
+    "[Gmail]/Category Updates": 'X-GM-RAW "category:updates"',
+    "[Gmail]/Category Forums": 'X-GM-RAW "category:forums"'
+}
+
+# Durée pendant laquelle le résultat d'une recherche sur le serveur est réutilisé sans requête IMAP
+SEARCH_CACHE_TTL = 120
+
+# Au-delà, la recherche est refaite entièrement (messages supprimés ou déplacés entre-temps)
+SEARCH_CACHE_MAX_AGE = 900
+
+# Nombre de recherches gardées en cache, tous utilisateurs confondus
+SEARCH_CACHE_MAX_ENTRIES = 256
+
+# Nombre de résultats de recherche dont les en-têtes sont téléchargés
+SEARCH_RESULT_LIMIT = 50
+
+# Résultats de recherche par (utilisateur, requête, dossier, date) : UIDs trouvés et en-têtes déjà lus
+_search_cache = {}
+_search_cache_lock = threading.Lock()
 
 def get_gmail_categories():
     """Retourne la liste des catégories Gmail avec leurs dossiers IMAP correspondants"""
@@ -54,137 +94,739 @@ def get_gmail_categories():
         "Forums": "[Gmail]/Category Forums"
     }
 
-def fetch_emails_from_category(category_folder, since_date=None, limit=50):
-    """Récupère les emails d'une catégorie spécifique"""
-    try:
-        from auth_utils import get_current_user_credentials
-        credentials = get_current_user_credentials()
-        if not credentials:
-            st.error("❌ Impossible de récupérer les identifiants utilisateur")
-            return []
-        
-        username = credentials["email"]
-        password = credentials["password"]
-        
-        # Configuration IMAP
-        imap_server = "imap.gmail.com"
-        
-        # Connexion
-        mail = imaplib.IMAP4_SSL(imap_server)
-        mail.login(username, password)
+def _compress_uid_set(uids):
+    """Compresse une liste d'UIDs en séquence IMAP compacte (ex: 1201:1250,1300)"""
+    sorted_uids = sorted({int(uid) for uid in uids})
+    if not sorted_uids:
+        return ""
+    
+    ranges = []
+    start = previous = sorted_uids[0]
+    for uid in sorted_uids[1:]:
+        if uid == previous + 1:
+            previous = uid
+            continue
+        ranges.append((start, previous))
+        start = previous = uid
+    ranges.append((start, previous))
+    
+    return ",".join(f"{first}:{last}" if first != last else str(first) for first, last in ranges)
+
+def _tokenize_imap(text, literals):
+    """Découpe une réponse IMAP en jetons (parenthèses, atomes, chaînes, littéraux)"""
+    tokens = []
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char.isspace():
+            i += 1
+        elif char in "()":
+            tokens.append(char)
+            i += 1
+        elif char == "\x00":
+            # Marqueur de littéral : \x00<index>\x00
+            end = text.index("\x00", i + 1)
+            tokens.append(("literal", literals[int(text[i + 1:end])]))
+            i = end + 1
+        elif char == '"':
+            value = []
+            i += 1
+            while i < length and text[i] != '"':
+                if text[i] == "\\" and i + 1 < length:
+                    i += 1
+                value.append(text[i])
+                i += 1
+            tokens.append(("string", "".join(value)))
+            i += 1
+        else:
+            start = i
+            depth = 0
+            while i < length:
+                char = text[i]
+                if char == "[":
+                    depth += 1
+                elif char == "]":
+                    depth -= 1
+                elif depth == 0 and (char.isspace() or char in '()"\x00'):
+                    break
+                i += 1
+            atom = text[start:i]
+            tokens.append(("atom", None if atom.upper() == "NIL" else atom))
+    return tokens
+
+def _build_imap_lists(tokens):
+    """Reconstruit les listes imbriquées à partir des jetons IMAP"""
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) > 1:
+                closed = stack.pop()
+                stack[-1].append(closed)
+        else:
+            stack[-1].append(token[1])
+    while len(stack) > 1:
+        closed = stack.pop()
+        stack[-1].append(closed)
+    return stack[0]
+
+def _parse_fetch_response(data):
+    """Parse en une passe une réponse FETCH multi-messages en liste de dictionnaires {attribut: valeur}"""
+    text_parts = []
+    literals = []
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            prefix = item[0].decode('utf-8', errors='replace')
+            prefix = re.sub(r'~?\{\d+\}$', '', prefix)
+            text_parts.append(f"{prefix}\x00{len(literals)}\x00")
+            literals.append(item[1])
+        else:
+            text_parts.append(item.decode('utf-8', errors='replace'))
+    
+    values = _build_imap_lists(_tokenize_imap(" ".join(text_parts), literals))
+    
+    # La réponse est une suite de paires "<numéro de séquence> (<attributs>)"
+    records = []
+    for index in range(len(values) - 1):
+        if isinstance(values[index], str) and values[index].isdigit() and isinstance(values[index + 1], list):
+            attributes = values[index + 1]
+            record = {"SEQ": values[index]}
+            for key_index in range(0, len(attributes) - 1, 2):
+                key = attributes[key_index]
+                if isinstance(key, str):
+                    record[key.upper()] = attributes[key_index + 1]
+            records.append(record)
+    return records
+
+# Analyseur d'en-têtes seuls : le coût dépend de la taille des en-têtes, pas du message
+_header_parser = BytesHeaderParser()
+
+def _decode_header_parts(value):
+    """Décode les mots encodés RFC 2047 d'une valeur d'en-tête"""
+    decoded = ""
+    for part, encoding in decode_header(value):
+        if isinstance(part, bytes):
+            try:
+                decoded += part.decode(encoding or 'utf-8', errors='ignore')
+            except LookupError:
+                decoded += part.decode('utf-8', errors='ignore')
+        else:
+            decoded += part
+    return decoded
+
+@lru_cache(maxsize=4096)
+def _decode_header_cached(value):
+    """Décode une valeur d'en-tête texte, mémorisée (sujets et expéditeurs se répètent beaucoup)"""
+    return _decode_header_parts(value)
+
+def _decode_header_value(value):
+    """Décode une valeur d'en-tête, sans passer par decode_header quand elle est en ASCII simple"""
+    if not value:
+        return ""
+    if isinstance(value, str):
+        if value.isascii() and "=?" not in value:
+            return value
+        return _decode_header_cached(value)
+    # Header (octets non ASCII bruts) : non hachable, décodé sans mémorisation
+    return _decode_header_parts(value)
+
+def _decode_subject(msg):
+    """Décode le sujet d'un message (mots encodés RFC 2047)"""
+    return _decode_header_value(msg["Subject"]) or "Pas de sujet"
+
+def _parse_header_block(header_bytes):
+    """Analyse un bloc d'en-têtes seul et renvoie un enregistrement compact (expéditeur, sujet, date...)"""
+    headers = _header_parser.parsebytes(header_bytes)
+    return {
+        "from": headers.get("From") or "Expéditeur inconnu",
+        "to": headers.get("To") or "",
+        "subject": _decode_subject(headers),
+        "date": headers.get("Date") or "",
+        "message_id": headers.get("Message-ID") or ""
+    }
+
+def _is_before_since_date(date, since_date):
+    """Vérifie si la date d'un email est antérieure au filtre de date (à la seconde près pour un datetime)"""
+    if not (since_date and hasattr(since_date, 'date')):
+        return False
+    
+    email_datetime = parse_email_date(date)
+    return email_datetime < _since_datetime(since_date)
+
+def _since_datetime(since_date):
+    """Convertit le filtre de date (date ou datetime) en datetime UTC"""
+    if isinstance(since_date, datetime):
+        if since_date.tzinfo is None:
+            return since_date.replace(tzinfo=timezone.utc)
+        return since_date
+    return datetime.combine(since_date, datetime.min.time()).replace(tzinfo=timezone.utc)
+
+def _html_to_text(html):
+    """Retire les balises d'un corps HTML pour l'afficher en texte brut"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', html, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r'<[^>]*>', ' ', text)
+    return re.sub(r'[ \t]+', ' ', text).strip()
+
+def _parse_streamed_message(streamed, category_folder, since_date=None):
+    """Convertit le résultat de l'analyse par morceaux en dictionnaire email (None si hors filtre de date)"""
+    headers = streamed["headers"]
+    date = headers.get("Date") or ""
+    
+    # Vérifier si l'email correspond au filtre de date
+    if _is_before_since_date(date, since_date):
+        return None
+    
+    body = streamed["text"]
+    if streamed["text_type"] == "text/html":
+        body = _html_to_text(body)
+    
+    return {
+        "from": headers.get("From") or "Expéditeur inconnu",
+        "to": headers.get("To") or "",
+        "subject": _decode_subject(headers),
+        "date": date,
+        "message_id": headers.get("Message-ID") or "",
+        "body": body,
+        "attachments": streamed["attachments"],
+        "truncated": streamed["truncated"],
+        "category": category_folder,
+        "body_loaded": True
+    }
+
+def _snippet_from_partial(partial_body, max_length=SNIPPET_LENGTH, text_part=None):
+    """Construit un aperçu lisible à partir des premiers octets de la partie texte
+    
+    Avec text_part (décrite par la BODYSTRUCTURE), le contenu est décodé selon son encodage de transfert
+    et son jeu de caractères ; sinon le décodage est approximatif (UTF-8, quoted-printable deviné).
+    """
+    if not isinstance(partial_body, bytes):
+        return ""
+    
+    if text_part:
+        text = _decode_part(partial_body, text_part["encoding"], text_part["charset"])
+    else:
+        text = partial_body.decode('utf-8', errors='ignore')
         
-        # Lister tous les dossiers disponibles pour debug
-        # status, folders = mail.list()
-        # st.write(f"Dossiers disponibles: {[f.decode() for f in folders]}")
+        # Partie multipart imbriquée : ignorer la ligne de séparation et les en-têtes MIME
+        if text.lstrip().startswith("--"):
+            header_end = text.find("\r\n\r\n")
+            if header_end != -1:
+                text = text[header_end + 4:]
         
-        # Sélectionner le dossier de la catégorie
+        # Décodage quoted-printable approximatif (tronqué, donc sans garantie)
+        if re.search(r'=(\r?\n|[0-9A-F]{2})', text):
+            try:
+                text = quopri.decodestring(text.encode('utf-8', errors='ignore')).decode('utf-8', errors='ignore')
+            except Exception:
+                pass
+    
+    # Retirer les balises HTML éventuelles et normaliser les espaces
+    text = re.sub(r'<[^>]*>', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text[:max_length]
+
+def _parse_email_headers(record, category_folder, since_date=None):
+    """Convertit une réponse FETCH en-têtes seuls en dictionnaire email (corps chargé à la demande)"""
+    header_bytes = next((value for key, value in record.items() if key.startswith("BODY[HEADER")), None)
+    if not isinstance(header_bytes, bytes):
+        return None
+    
+    email_data = _parse_header_block(header_bytes)
+    if _is_before_since_date(email_data["date"], since_date):
+        return None
+    
+    if "BODYSTRUCTURE" in record:
+        # Partie texte choisie comme pour le corps complet ; sans partie texte, pas d'aperçu
+        text_part, _ = _select_text_part(record["BODYSTRUCTURE"])
+        prefix = f"BODY[{text_part['section']}]" if text_part else None
+    else:
+        text_part, prefix = None, "BODY[1]"
+    partial_body = next((value for key, value in record.items() if prefix and key.startswith(prefix)), None)
+    snippet = _snippet_from_partial(partial_body, text_part=text_part)
+    
+    return {
+        **email_data,
+        "body": snippet,
+        "snippet": snippet,
+        "size": int(record.get("RFC822.SIZE") or 0),
+        "category": category_folder,
+        "body_loaded": False
+    }
+
+def _run_imap(operation, credentials=None):
+    """Exécute operation(mail) sur une session IMAP du pool, avec une reconnexion si la connexion a été coupée"""
+    if credentials is None:
+        from auth_utils import get_current_user_credentials
+        credentials = get_current_user_credentials()
+    if not credentials:
+        st.error("❌ Impossible de récupérer les identifiants utilisateur")
+        return None
+    
+    for attempt in range(2):
         try:
-            status, count = mail.select(category_folder)
-            if status != "OK":
-                st.warning(f"⚠️ Impossible d'accéder à la catégorie '{category_folder}'")
-                mail.logout()
-                return []
-        except Exception as e:
-            st.warning(f"⚠️ Catégorie '{category_folder}' non disponible: {str(e)}")
-            mail.logout()
+            with imap_pool.connection(credentials["email"], credentials["password"]) as mail:
+                return operation(mail)
+        except imaplib.IMAP4.abort:
+            # La session fautive a été retirée du pool : réessayer une fois avec une nouvelle
+            if attempt:
+                raise
+
+def _quote_mailbox(folder):
+    """Entoure de guillemets un nom de dossier IMAP (imaplib ne le fait pas, ex: "[Gmail]/All Mail")"""
+    if folder.startswith('"'):
+        return folder
+    return '"' + folder.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _select_folder(mail, category_folder, readonly=False):
+    """Sélectionne un dossier IMAP en signalant les catégories inaccessibles"""
+    try:
+        status, count = mail.select(_quote_mailbox(category_folder), readonly=readonly)
+        if status != "OK":
+            st.warning(f"⚠️ Impossible d'accéder à la catégorie '{category_folder}'")
+            return False
+    except imaplib.IMAP4.abort:
+        raise
+    except Exception as e:
+        st.warning(f"⚠️ Catégorie '{category_folder}' non disponible: {str(e)}")
+        return False
+    return True
+
+def _fetch_internaldate(mail, sequence_number):
+    """Lit la date de réception (INTERNALDATE) d'un message par numéro de séquence"""
+    status, data = mail.fetch(str(sequence_number), "(INTERNALDATE)")
+    if status != "OK":
+        return None
+    
+    for record in _parse_fetch_response(data):
+        value = record.get("INTERNALDATE")
+        if value:
+            try:
+                return datetime.strptime(value.strip(), "%d-%b-%Y %H:%M:%S %z")
+            except ValueError:
+                return None
+    return None
+
+def _locate_first_seq_since(mail, since_date, message_count):
+    """Trouve par dichotomie sur INTERNALDATE le premier numéro de séquence reçu après since_date
+    
+    Les numéros de séquence suivent l'ordre d'arrivée, donc INTERNALDATE est (presque) croissant :
+    environ log2(n) requêtes d'un attribut chacune, au lieu d'un SEARCH sur tout le dossier.
+    """
+    since_datetime = _since_datetime(since_date)
+    low, high = 1, message_count + 1
+    while low < high:
+        middle = (low + high) // 2
+        internaldate = _fetch_internaldate(mail, middle)
+        if internaldate is not None and internaldate < since_datetime:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+def _uid_before_criteria(before_uid):
+    """Critère SEARCH limitant aux UIDs strictement inférieurs à before_uid (curseur de page)"""
+    return f" UID 1:{int(before_uid) - 1}" if before_uid else ""
+
+def _search_recent_uids(mail, since_date=None, limit=None, before_uid=None):
+    """Renvoie les UIDs des derniers messages du dossier sélectionné reçus depuis since_date (et avant before_uid)"""
+    if before_uid and int(before_uid) <= 1:
+        return []
+    message_count = _select_response_int(mail, 'EXISTS') or 0
+    exact_cutoff = isinstance(since_date, datetime)
+    
+    if since_date and message_count and (exact_cutoff or message_count > INTERNALDATE_SEARCH_THRESHOLD):
+        # Heure précise ou gros dossier : ne chercher que la fin du dossier
+        first_seq = _locate_first_seq_since(mail, since_date, message_count)
+        if first_seq > message_count:
             return []
-        
-        # Construire la requête de recherche
+        if limit and not before_uid:
+            first_seq = max(first_seq, message_count - limit + 1)
+        status, messages = mail.uid('SEARCH', None, f"{first_seq}:{message_count}{_uid_before_criteria(before_uid)}")
+    else:
         search_criteria = "ALL"
-        if since_date:
-            if hasattr(since_date, 'strftime'):
-                date_str = since_date.strftime('%d-%b-%Y')
-                search_criteria = f'(SINCE {date_str})'
-        
-        # Rechercher les emails
-        status, messages = mail.search(None, search_criteria)
+        if since_date and hasattr(since_date, 'strftime'):
+            search_criteria = f"(SINCE {since_date.strftime('%d-%b-%Y')})"
+        status, messages = mail.uid('SEARCH', None, search_criteria + _uid_before_criteria(before_uid))
+    
+    if status != "OK":
+        return None
+    
+    email_uids = messages[0].split()
+    # Prendre les derniers emails (limité)
+    return email_uids[-limit:] if limit else email_uids
+
+def _structure_params(values):
+    """Convertit une liste de paramètres BODYSTRUCTURE ("NAME" "valeur" ...) en dictionnaire"""
+    if not isinstance(values, list):
+        return {}
+    return {
+        str(values[index]).lower(): values[index + 1]
+        for index in range(0, len(values) - 1, 2)
+        if isinstance(values[index], str)
+    }
+
+def _decode_mime_words(value):
+    """Décode un nom de fichier ou un en-tête encodé (RFC 2047)"""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+def _walk_bodystructure(structure, section=""):
+    """Parcourt une BODYSTRUCTURE et génère la description de chaque partie feuille avec son numéro de section"""
+    if not isinstance(structure, list) or not structure:
+        return
+    
+    if isinstance(structure[0], list):
+        # multipart : parties filles puis sous-type et extensions
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from _walk_bodystructure(child, f"{section}.{index}" if section else str(index))
+        return
+    
+    content_type = f"{structure[0]}/{structure[1]}".lower() if len(structure) > 1 else "application/octet-stream"
+    params = _structure_params(structure[2] if len(structure) > 2 else None)
+    
+    # Position de la disposition selon le type (RFC 3501, body-ext-1part)
+    if content_type.startswith("text/"):
+        disposition_index = 9
+    elif content_type == "message/rfc822":
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    disposition_type = ""
+    if isinstance(disposition, list) and disposition and isinstance(disposition[0], str):
+        disposition_type = disposition[0].lower()
+        params = dict(params, **_structure_params(disposition[1] if len(disposition) > 1 else None))
+    
+    try:
+        size = int(structure[6])
+    except (IndexError, TypeError, ValueError):
+        size = 0
+    
+    filename = params.get("filename") or params.get("name")
+    yield {
+        "section": section or "1",
+        "content_type": content_type,
+        "charset": params.get("charset") or "utf-8",
+        "encoding": str(structure[5] or "7bit").lower() if len(structure) > 5 else "7bit",
+        "size": size,
+        "filename": _decode_mime_words(filename) if filename else None,
+        "is_attachment": disposition_type == "attachment" or bool(filename) or not content_type.startswith("text/")
+    }
+
+def _select_text_part(structure):
+    """Choisit la partie texte à télécharger (text/plain, sinon text/html) et liste les pièces jointes"""
+    text_part = None
+    html_part = None
+    attachments = []
+    for part in _walk_bodystructure(structure):
+        if part["is_attachment"]:
+            attachments.append({
+                "filename": part["filename"] or "sans nom",
+                "size": part["size"],
+                "content_type": part["content_type"]
+            })
+        elif part["content_type"] == "text/plain" and text_part is None:
+            text_part = part
+        elif part["content_type"] == "text/html" and html_part is None:
+            html_part = part
+    return text_part or html_part, attachments
+
+def _decode_part(payload, encoding, charset):
+    """Décode le contenu d'une partie MIME (transfert base64/quoted-printable puis jeu de caractères)"""
+    if not isinstance(payload, bytes):
+        return ""
+    try:
+        if encoding == "base64":
+            # Partie éventuellement tronquée par un FETCH partiel : ignorer le groupe incomplet final
+            payload = b"".join(payload.split())
+            payload = base64.b64decode(payload[:len(payload) - len(payload) % 4])
+        elif encoding == "quoted-printable":
+            payload = quopri.decodestring(payload)
+    except (binascii.Error, ValueError):
+        pass
+    try:
+        return payload.decode(charset, errors='ignore')
+    except LookupError:
+        return payload.decode('utf-8', errors='ignore')
+
+def _text_part_requests(records):
+    """Regroupe les UIDs par section de partie texte, pour une requête UID FETCH par section"""
+    uids_by_section = {}
+    for record in records:
+        if "BODYSTRUCTURE" not in record or not record.get("UID"):
+            continue
+        text_part, attachments = _select_text_part(record["BODYSTRUCTURE"])
+        if text_part:
+            uids_by_section.setdefault(text_part["section"], []).append(record["UID"])
+    return uids_by_section
+
+def _merge_part_records(records, part_data):
+    """Ajoute les parties texte téléchargées (BODY[x.y]) aux entrées correspondantes par UID"""
+    records_by_uid = {record.get("UID"): record for record in records}
+    for part_record in _parse_fetch_response(part_data):
+        target = records_by_uid.get(part_record.get("UID"))
+        if target is not None:
+            target.update({key: value for key, value in part_record.items() if key.startswith("BODY[")})
+
+def _text_part_fetch_items(section):
+    """Attributs FETCH d'une partie texte, bornée à MAX_TEXT_SIZE octets"""
+    return f"(BODY.PEEK[{section}]<0.{MAX_TEXT_SIZE}>)"
+
+def _snippet_part_requests(records):
+    """Sections texte à lire pour l'aperçu, hors section 1 déjà demandée avec les en-têtes"""
+    return {section: uids for section, uids in _text_part_requests(records).items() if section != "1"}
+
+def _snippet_fetch_items(section):
+    """Attributs FETCH du début d'une partie texte, pour l'aperçu"""
+    return f"(BODY.PEEK[{section}]<0.{SNIPPET_FETCH_SIZE}>)"
+
+def _fetch_text_parts(mail, records):
+    """Télécharge uniquement les parties texte choisies d'après la BODYSTRUCTURE de chaque message"""
+    for section, uids in _text_part_requests(records).items():
+        status, part_data = mail.uid('FETCH', _compress_uid_set(uids), _text_part_fetch_items(section))
+        if status == "OK":
+            _merge_part_records(records, part_data)
+
+def _parse_structured_message(record, category_folder, since_date=None):
+    """Construit un dictionnaire email à partir des en-têtes, de la BODYSTRUCTURE et de la partie texte téléchargée"""
+    header_bytes = record.get("BODY[HEADER]")
+    if not isinstance(header_bytes, bytes):
+        return None
+    
+    email_data = _parse_header_block(header_bytes)
+    if _is_before_since_date(email_data["date"], since_date):
+        return None
+    
+    text_part, attachments = _select_text_part(record.get("BODYSTRUCTURE"))
+    body = ""
+    if text_part:
+        # Réponse "BODY[1.1]<0>" pour un FETCH partiel
+        prefix = f"BODY[{text_part['section']}]"
+        payload = next((value for key, value in record.items() if key.startswith(prefix)), None)
+        body = _decode_part(payload, text_part["encoding"], text_part["charset"])
+        if text_part["content_type"] == "text/html":
+            body = _html_to_text(body)
+    
+    return {
+        **email_data,
+        "body": body,
+        "attachments": attachments,
+        "category": category_folder,
+        "body_loaded": True
+    }
+
+def _iter_message_chunks(mail, uid, chunk_size=MESSAGE_CHUNK_SIZE, max_size=None):
+    """Lit un message par FETCH partiels successifs ; s'arrête à max_size octets"""
+    offset = 0
+    while max_size is None or offset < max_size:
+        length = chunk_size if max_size is None else min(chunk_size, max_size - offset)
+        status, chunk_data = mail.uid('FETCH', str(uid), f"(BODY.PEEK[]<{offset}.{length}>)")
         if status != "OK":
-            mail.logout()
-            return []
+            return
+        chunk = next(
+            (value for record in _parse_fetch_response(chunk_data)
+             for key, value in record.items() if key.startswith("BODY[]")),
+            None
+        )
+        if not isinstance(chunk, bytes) or not chunk:
+            return
+        yield chunk
+        if len(chunk) < length:
+            return
+        offset += len(chunk)
+
+def _stream_message(mail, uid, size=None):
+    """Analyse un message par morceaux, en gardant seulement les parties texte en mémoire"""
+    from config import MAX_MESSAGE_SIZE
+    
+    streamed = parse_message_stream(_iter_message_chunks(mail, uid, max_size=MAX_MESSAGE_SIZE))
+    if size and size > MAX_MESSAGE_SIZE:
+        streamed["truncated"] = True
+    return streamed
+
+def _fetch_items_for(headers_only, gmail_attributes):
+    """Construit la liste d'attributs UID FETCH selon le mode (en-têtes seuls, structure MIME, attributs Gmail)"""
+    if headers_only:
+        fetch_items = HEADERS_FETCH_ITEMS
+    else:
+        fetch_items = STRUCTURE_FETCH_ITEMS
+    if gmail_attributes:
+        fetch_items = f"({GMAIL_FETCH_ITEMS} {fetch_items[1:]}"
+    return fetch_items
+
+def _email_from_fetch_record(record, category_folder, since_date, headers_only, gmail_attributes, uidvalidity):
+    """Convertit une entrée de réponse UID FETCH en dictionnaire email (None si hors filtre ou incomplète)"""
+    from database_utils import generate_email_id
+    
+    if headers_only:
+        email_data = _parse_email_headers(record, category_folder, since_date)
+    elif "STREAMED" in record:
+        email_data = _parse_streamed_message(record["STREAMED"], category_folder, since_date)
+    elif "BODYSTRUCTURE" in record:
+        email_data = _parse_structured_message(record, category_folder, since_date)
+    else:
+        return None
+    if not email_data:
+        return None
+    
+    email_data["uid"] = record.get("UID")
+    email_data["folder"] = category_folder
+    if "FLAGS" in record:
+        email_data["is_processed"] = "\\Seen" in (record["FLAGS"] or [])
+    if gmail_attributes:
+        email_data["gm_msgid"] = record.get("X-GM-MSGID")
+        email_data["gm_thrid"] = record.get("X-GM-THRID")
+        email_data["labels"] = record.get("X-GM-LABELS") or []
+    email_data["uidvalidity"] = uidvalidity
+    email_data["email_id"] = generate_email_id(email_data)
+    # Date analysée une seule fois, à l'ingestion : tris et filtres utilisent ensuite "timestamp"
+    annotate_email_dates([email_data])
+    return email_data
+
+def _iter_uid_batches(mail, uids, category_folder, since_date=None, batch_size=IMAP_FETCH_BATCH_SIZE, headers_only=False, gmail_attributes=None, failed_uids=None):
+    """Génère, lot par lot et dans l'ordre des UIDs donnés, les emails du dossier sélectionné
+    
+    Les UIDs d'un lot ou d'un message en échec sont ajoutés à failed_uids (si fourni) ; les UIDs
+    absents d'une réponse OK (messages supprimés entre-temps) n'y figurent pas.
+    """
+    # X-GM-MSGID fournit l'identifiant le plus stable : le demander dès que le serveur le propose
+    if gmail_attributes is None:
+        gmail_attributes = "X-GM-EXT-1" in mail.capabilities
+    uidvalidity = _select_response_int(mail, 'UIDVALIDITY')
+    fetch_items = _fetch_items_for(headers_only, gmail_attributes)
+    
+    for batch_start in range(0, len(uids), batch_size):
+        batch = uids[batch_start:batch_start + batch_size]
+        try:
+            status, msg_data = mail.uid('FETCH', _compress_uid_set(batch), fetch_items)
+            if status != "OK":
+                if failed_uids is not None:
+                    failed_uids.extend(batch)
+                continue
+        except imaplib.IMAP4.abort:
+            raise
+        except Exception as e:
+            if failed_uids is not None:
+                failed_uids.extend(batch)
+            continue
         
-        email_ids = messages[0].split()
+        records = _parse_fetch_response(msg_data)
+        if headers_only:
+            # Aperçu : début de la partie texte quand ce n'est pas la section 1 (ex. multipart imbriqué)
+            try:
+                for section, section_uids in _snippet_part_requests(records).items():
+                    status, part_data = mail.uid('FETCH', _compress_uid_set(section_uids), _snippet_fetch_items(section))
+                    if status == "OK":
+                        _merge_part_records(records, part_data)
+            except imaplib.IMAP4.abort:
+                raise
+            except Exception as e:
+                pass
+        else:
+            # Seconde passe : uniquement les parties texte, regroupées par numéro de section
+            try:
+                _fetch_text_parts(mail, records)
+                # Sans BODYSTRUCTURE exploitable, lire le message par morceaux plutôt qu'en un seul littéral
+                for record in records:
+                    if "BODYSTRUCTURE" not in record and record.get("UID"):
+                        record["STREAMED"] = _stream_message(mail, record["UID"], int(record.get("RFC822.SIZE") or 0))
+            except imaplib.IMAP4.abort:
+                raise
+            except Exception as e:
+                # Corps incomplets : à reprendre au prochain passage
+                if failed_uids is not None:
+                    failed_uids.extend(batch)
         
         emails = []
-        # Prendre les derniers emails (limité)
-        for email_id in email_ids[-limit:]:
+        for record in records:
             try:
-                status, msg_data = mail.fetch(email_id, "(RFC822)")
-                if status != "OK":
-                    continue
-                
-                msg = email.message_from_bytes(msg_data[0][1])
-                
-                # Extraire les informations
-                subject = ""
-                if msg["Subject"]:
-                    subject_parts = decode_header(msg["Subject"])
-                    for part, encoding in subject_parts:
-                        if isinstance(part, bytes):
-                            subject += part.decode(encoding or 'utf-8', errors='ignore')
-                        else:
-                            subject += part
-                
-                if not subject:
-                    subject = "Pas de sujet"
-                    
-                from_email = msg.get("From", "Expéditeur inconnu")
-                to_email = msg.get("To", "")
-                date = msg.get("Date", "")
-                
-                # Parser la date pour vérification
-                email_datetime = parse_email_date(date)
-                
-                # Vérifier si l'email correspond au filtre de date
-                if since_date and hasattr(since_date, 'date'):
-                    if hasattr(since_date, 'tzinfo'):
-                        since_datetime = since_date
-                    else:
-                        since_datetime = datetime.combine(since_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-                    
-                    if email_datetime.date() < since_datetime.date():
-                        continue
-                
-                # Extraire le corps du message
-                body = ""
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        if part.get_content_type() == "text/plain":
-                            try:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    body = payload.decode('utf-8', errors='ignore')
-                                    break
-                            except:
-                                continue
-                else:
-                    try:
-                        payload = msg.get_payload(decode=True)
-                        if payload:
-                            body = payload.decode('utf-8', errors='ignore')
-                    except:
-                        body = "Impossible de décoder le contenu"
-                
-                # Créer un ID unique pour l'email
-                email_unique_id = f"{category_folder}_{from_email}_{subject}_{date}"
-                
-                emails.append({
-                    "email_id": email_unique_id,
-                    "from": from_email,
-                    "to": to_email,
-                    "subject": subject,
-                    "date": date,
-                    "body": body,
-                    "category": category_folder
-                })
-                
+                email_data = _email_from_fetch_record(record, category_folder, since_date, headers_only, gmail_attributes, uidvalidity)
+                if email_data:
+                    emails.append(email_data)
             except Exception as e:
+                if failed_uids is not None and record.get("UID"):
+                    failed_uids.append(record["UID"])
                 continue
         
-        mail.close()
-        mail.logout()
+        if emails:
+            yield emails
+
+def _fetch_uids(mail, uids, category_folder, since_date=None, batch_size=IMAP_FETCH_BATCH_SIZE, headers_only=False, gmail_attributes=None, failed_uids=None):
+    """Récupère par lots de UIDs des emails du dossier sélectionné"""
+    return [
+        email_data
+        for batch in _iter_uid_batches(mail, uids, category_folder, since_date, batch_size, headers_only, gmail_attributes, failed_uids)
+        for email_data in batch
+    ]
+
+def iter_emails(folder, since=None, batch_size=IMAP_FETCH_BATCH_SIZE, limit=50, headers_only=False, batches=False, credentials=None, before_uid=None):
+    """Génère les emails d'un dossier au fur et à mesure de leur arrivée, des plus récents aux plus anciens
+    
+    Chaque lot UID FETCH est analysé et transmis dès sa réception : l'appelant peut afficher ou
+    enregistrer les premiers emails pendant que les lots suivants sont encore en transit.
+    Avec batches=True, le générateur renvoie des listes (un lot, trié par date) plutôt que des emails.
+    before_uid (plus petit UID déjà affiché) donne la page suivante, plus ancienne.
+    La session IMAP reste empruntée au pool tant que le générateur n'est pas épuisé ou fermé.
+    """
+    if credentials is None:
+        from auth_utils import get_current_user_credentials
+        credentials = get_current_user_credentials()
+    if not credentials:
+        st.error("❌ Impossible de récupérer les identifiants utilisateur")
+        return
+    
+    for attempt in range(2):
+        started = False
+        try:
+            with imap_pool.connection(credentials["email"], credentials["password"]) as mail:
+                if not _select_folder(mail, folder):
+                    return
+                
+                uids = _search_recent_uids(mail, since, limit, before_uid)
+                if not uids:
+                    return
+                
+                # Les UIDs les plus élevés sont les plus récents : les demander en premier
+                for batch in _iter_uid_batches(mail, list(reversed(uids)), folder, since, batch_size, headers_only):
+                    sort_emails_by_date(batch)
+                    started = True
+                    if batches:
+                        yield batch
+                    else:
+                        yield from batch
+            return
+        except imaplib.IMAP4.abort:
+            # Reconnexion possible seulement si rien n'a encore été transmis à l'appelant
+            if attempt or started:
+                raise
+
+def fetch_emails_from_category(category_folder, since_date=None, limit=50, batch_size=IMAP_FETCH_BATCH_SIZE, headers_only=False, credentials=None, before_uid=None):
+    """Récupère les emails d'une catégorie spécifique (en-têtes et aperçu seulement si headers_only)"""
+    try:
+        emails = list(iter_emails(
+            category_folder,
+            since=since_date,
+            batch_size=batch_size,
+            limit=limit,
+            headers_only=headers_only,
+            credentials=credentials,
+            before_uid=before_uid
+        ))
+        if not emails:
+            return []
         
         # Trier les emails par date (plus récents en premier)
-        emails.sort(key=lambda x: parse_email_date(x.get('date', '')), reverse=True)
+        sort_emails_by_date(emails)
         
         return emails
         
@@ -192,36 +834,620 @@ def fetch_emails_from_category(category_folder, since_date=None, limit=50):
         st.error(f"❌ Erreur IMAP pour catégorie '{category_folder}': {str(e)}")
         return []
 
-def fetch_all_categorized_emails(since_date=None, limit_per_category=50):
-    """Récupère les emails de toutes les catégories Gmail"""
-    all_emails = {}
-    categories = get_gmail_categories()
+def _fetch_full_message(mail, category_folder, uid):
+    """Télécharge les en-têtes et la partie texte d'un message par UID sans le marquer comme lu"""
+    if not _select_folder(mail, category_folder, readonly=True):
+        return None
     
-    total_emails = 0
+    # Les pièces jointes ne sont pas téléchargées : seules leurs métadonnées sont lues
+    emails = _fetch_uids(mail, [str(uid)], category_folder)
+    return emails[0] if emails else None
+
+def fetch_email_body(category_folder, uid):
+    """Télécharge le message complet d'un email listé en mode en-têtes seuls"""
+    try:
+        return _run_imap(lambda mail: _fetch_full_message(mail, category_folder, uid))
+    except Exception as e:
+        st.error(f"❌ Erreur lors du chargement du message : {str(e)}")
+        return None
+
+def load_email_body(email_data, user_id=None):
+    """Complète un email listé sans son corps (en-têtes IMAP seuls ou liste Supabase) avec son corps complet"""
+    if email_data.get('body_loaded', True):
+        return email_data
     
-    for category_name, folder_name in categories.items():
-        with st.spinner(f"📥 Chargement de '{category_name}'..."):
-            emails = fetch_emails_from_category(folder_name, since_date, limit_per_category)
-            all_emails[category_name] = emails
-            total_emails += len(emails)
-            
-            if emails:
-                st.success(f"✅ {len(emails)} emails chargés depuis '{category_name}'")
-            else:
-                st.info(f"📭 Aucun email dans '{category_name}'")
+    if email_data.get('uid'):
+        full_email = fetch_email_body(email_data.get('folder') or email_data.get('category'), email_data['uid'])
+        if full_email:
+            email_data['body'] = full_email['body']
+            email_data['attachments'] = full_email.get('attachments', [])
+            email_data['body_loaded'] = True
+    elif email_data.get('db_id') and user_id:
+        from database_utils import get_email_body
+        
+        body = get_email_body(user_id, email_data['db_id'])
+        if body is not None:
+            email_data['body'] = body
+            email_data['body_loaded'] = True
+    return email_data
+
+def _map_categories_in_parallel(task, categories, on_complete=None):
+    """Exécute task(nom, dossier) pour chaque catégorie en parallèle et renvoie {nom: résultat} dans l'ordre des catégories"""
+    if not categories:
+        return {}
+    
+    # Les threads partagent le contexte Streamlit de la session pour pouvoir afficher des messages
+    script_run_ctx = get_script_run_ctx()
+    
+    def attach_script_run_ctx():
+        if script_run_ctx:
+            add_script_run_ctx(threading.current_thread(), script_run_ctx)
+    
+    results = {}
+    max_workers = min(len(categories), MAX_PARALLEL_FOLDERS)
+    with ThreadPoolExecutor(max_workers=max_workers, initializer=attach_script_run_ctx) as executor:
+        futures = {
+            executor.submit(task, category_name, folder_name): category_name
+            for category_name, folder_name in categories.items()
+        }
+        for future in as_completed(futures):
+            category_name = futures[future]
+            results[category_name] = future.result()
+            if on_complete:
+                on_complete(category_name, results[category_name], len(results))
+    
+    return {category_name: results[category_name] for category_name in categories}
+
+def merge_categorized_emails(emails_by_category, limit=None):
+    """Fusionne les listes par catégorie (déjà triées du plus récent au plus ancien) en une boîte unifiée
     
+    Fusion k-voies par tas (heapq.merge) : seuls les `limit` premiers emails sont parcourus,
+    sans retrier l'ensemble. Un même message présent dans plusieurs catégories n'apparaît qu'une fois.
+    """
+    merged = heapq.merge(*emails_by_category.values(), key=email_timestamp, reverse=True)
+    
+    seen_ids = set()
+    def unique(emails):
+        for email_data in emails:
+            email_id = email_data.get("email_id")
+            if email_id:
+                if email_id in seen_ids:
+                    continue
+                seen_ids.add(email_id)
+            yield email_data
+    
+    return list(islice(unique(merged), limit))
+
+def fetch_all_categorized_emails(since_date=None, limit_per_category=50, headers_only=False, single_pass=False, categories=None, before_uids=None):
+    """Récupère les emails de toutes les catégories Gmail (en parallèle, ou en un passage sur "Tous les messages" si single_pass)
+    
+    categories restreint le chargement à certaines catégories ({nom: dossier}) ; before_uids ({nom: UID})
+    donne pour chacune la page suivante, plus ancienne que l'UID indiqué.
+    """
+    from auth_utils import get_current_user_credentials
+    
+    # Les identifiants sont lus une seule fois, dans le thread de la session Streamlit
+    credentials = get_current_user_credentials()
+    if not credentials:
+        st.error("❌ Impossible de récupérer les identifiants utilisateur")
+        return {}
+    
+    if single_pass:
+        with st.spinner("📥 Chargement de toutes les catégories..."):
+            all_emails = fetch_all_categorized_emails_single_pass(
+                since_date, limit_per_category, headers_only=headers_only, credentials=credentials,
+                categories=categories, before_uids=before_uids
+            )
+        if all_emails is not None:
+            total_emails = sum(len(emails) for emails in all_emails.values())
+            st.success(f"🎉 Total: {total_emails} emails chargés depuis toutes les catégories")
+            return all_emails
+        # Serveur sans extensions Gmail : repli sur le chargement dossier par dossier
+    
+    if categories is None:
+        categories = get_gmail_categories()
+    before_uids = before_uids or {}
+    progress = st.progress(0.0, text="📥 Chargement des catégories...")
+    
+    def report_progress(category_name, emails, completed):
+        progress.progress(completed / len(categories), text=f"📥 {completed}/{len(categories)} catégories chargées")
+        if emails:
+            st.success(f"✅ {len(emails)} emails chargés depuis '{category_name}'")
+        else:
+            st.info(f"📭 Aucun email dans '{category_name}'")
+    
+    all_emails = _map_categories_in_parallel(
+        lambda category_name, folder_name: fetch_emails_from_category(
+            folder_name, since_date, limit_per_category, headers_only=headers_only, credentials=credentials,
+            before_uid=before_uids.get(category_name)
+        ),
+        categories,
+        report_progress
+    )
+    progress.empty()
+    
+    total_emails = sum(len(emails) for emails in all_emails.values())
     st.success(f"🎉 Total: {total_emails} emails chargés depuis toutes les catégories")
     return all_emails
 
+def _find_all_mail_folder(mail):
+    """Trouve le dossier "Tous les messages" de Gmail (attribut \\All, nom localisé)"""
+    all_mail_folder = getattr(mail, "mail_utils_all_mail", None)
+    if all_mail_folder:
+        return all_mail_folder
+    
+    status, folders = mail.list()
+    if status != "OK":
+        return None
+    
+    for line in folders or []:
+        if not isinstance(line, bytes):
+            continue
+        values = _build_imap_lists(_tokenize_imap(line.decode('utf-8', errors='replace'), []))
+        if len(values) >= 3 and isinstance(values[0], list) and "\\All" in values[0]:
+            # Mémorisé sur la session du pool : le nom ne change pas
+            mail.mail_utils_all_mail = values[-1]
+            return values[-1]
+    return None
+
+def _fetch_all_mail_single_pass(mail, categories, since_date, limit_per_category, batch_size, headers_only, before_uids=None):
+    """Récupère toutes les catégories en un seul passage sur "Tous les messages", sans double téléchargement"""
+    all_mail_folder = _find_all_mail_folder(mail)
+    if not all_mail_folder or not _select_folder(mail, all_mail_folder, readonly=True):
+        return None
+    
+    since_criteria = ""
+    if since_date and hasattr(since_date, 'strftime'):
+        since_criteria = f" SINCE {since_date.strftime('%d-%b-%Y')}"
+    
+    # Répartition des UIDs par catégorie : les recherches ne renvoient que des UIDs
+    uids_by_category = {}
+    for category_name, folder_name in categories.items():
+        search = GMAIL_CATEGORY_SEARCHES.get(folder_name)
+        if not search:
+            continue
+        before_uid = (before_uids or {}).get(category_name)
+        if before_uid and int(before_uid) <= 1:
+            continue
+        status, messages = mail.uid('SEARCH', None, f"({search}{since_criteria}{_uid_before_criteria(before_uid)})")
+        if status != "OK":
+            continue
+        category_uids = messages[0].split()
+        uids_by_category[category_name] = category_uids[-limit_per_category:] if limit_per_category else category_uids
+    
+    # Chaque message n'est téléchargé qu'une fois, même s'il appartient à plusieurs catégories
+    all_uids = sorted({int(uid) for uids in uids_by_category.values() for uid in uids})
+    fetched = _fetch_uids(mail, all_uids, all_mail_folder, since_date, batch_size, headers_only, gmail_attributes=True)
+    emails_by_uid = {int(email_data["uid"]): email_data for email_data in fetched if email_data.get("uid")}
+    
+    all_emails = {}
+    for category_name, folder_name in categories.items():
+        emails = []
+        seen_ids = set()
+        for uid in uids_by_category.get(category_name, []):
+            email_data = emails_by_uid.get(int(uid))
+            if email_data and email_data["email_id"] not in seen_ids:
+                seen_ids.add(email_data["email_id"])
+                emails.append(dict(email_data, category=folder_name))
+        sort_emails_by_date(emails)
+        all_emails[category_name] = emails
+    return all_emails
+
+def fetch_all_categorized_emails_single_pass(since_date=None, limit_per_category=50, headers_only=False, batch_size=IMAP_FETCH_BATCH_SIZE, credentials=None, categories=None, before_uids=None):
+    """Récupère toutes les catégories Gmail depuis "Tous les messages" en un seul SELECT (None si non supporté)"""
+    try:
+        if categories is None:
+            categories = get_gmail_categories()
+        
+        def single_pass(mail):
+            if "X-GM-EXT-1" not in mail.capabilities:
+                return None
+            return _fetch_all_mail_single_pass(mail, categories, since_date, limit_per_category, batch_size, headers_only, before_uids)
+        
+        return _run_imap(single_pass, credentials)
+        
+    except Exception as e:
+        st.error(f"❌ Erreur IMAP lors du passage sur 'Tous les messages': {str(e)}")
+        return None
+
+def _search_uids(mail, query, gmail, criteria=(), min_uid=None):
+    """UIDs du dossier sélectionné correspondant à une recherche libre (X-GM-RAW sur Gmail, TEXT sinon)"""
+    search_args = [] if query.isascii() else ['CHARSET', 'UTF-8']
+    if min_uid:
+        search_args += ['UID', f'{min_uid}:*']
+    search_args += list(criteria)
+    search_args.append('X-GM-RAW' if gmail else 'TEXT')
+    # La requête est envoyée en littéral : guillemets et accents passent sans échappement
+    mail.literal = query.encode('utf-8')
+    status, messages = mail.uid('SEARCH', *search_args)
+    if status != "OK":
+        return None
+    
+    uids = [int(uid) for uid in (messages[0] or b"").split()]
+    if min_uid:
+        # "n:*" renvoie toujours le dernier message, même si son UID est inférieur à n
+        uids = [uid for uid in uids if uid >= min_uid]
+    return uids
+
+def _search_target(mail, category_folder):
+    """Dossier et critères d'une recherche serveur : "Tous les messages" filtré par catégorie sur Gmail, sinon le dossier lui-même"""
+    gmail = "X-GM-EXT-1" in mail.capabilities
+    if gmail:
+        all_mail_folder = _find_all_mail_folder(mail)
+        if all_mail_folder:
+            category_search = GMAIL_CATEGORY_SEARCHES.get(category_folder)
+            return all_mail_folder, [category_search] if category_search else [], True
+    return category_folder or "INBOX", [], gmail
+
+def _refresh_search(mail, query, category_folder, since_date, limit, entry):
+    """Exécute ou complète une recherche serveur et renvoie la nouvelle entrée de cache"""
+    folder, criteria, gmail = _search_target(mail, category_folder)
+    if not _select_folder(mail, folder, readonly=True):
+        return None
+    
+    uidvalidity = _select_response_int(mail, 'UIDVALIDITY')
+    uidnext = _select_response_int(mail, 'UIDNEXT')
+    if since_date and hasattr(since_date, 'strftime'):
+        criteria = criteria + ['SINCE', since_date.strftime('%d-%b-%Y')]
+    
+    now = time.monotonic()
+    reusable = (
+        entry is not None
+        and entry['folder'] == folder
+        and entry['uidvalidity'] == uidvalidity
+        and entry['uidnext']
+        and now - entry['searched_at'] < SEARCH_CACHE_MAX_AGE
+    )
+    if reusable:
+        uids, emails, searched_at = list(entry['uids']), dict(entry['emails']), entry['searched_at']
+        # Recherche incrémentale : seuls les messages arrivés depuis la dernière recherche (UIDNEXT)
+        if uidnext != entry['uidnext']:
+            new_uids = _search_uids(mail, query, gmail, criteria, min_uid=entry['uidnext'])
+            if new_uids is None:
+                return None
+            known_uids = set(uids)
+            uids.extend(uid for uid in new_uids if uid not in known_uids)
+    else:
+        uids = _search_uids(mail, query, gmail, criteria)
+        if uids is None:
+            return None
+        emails, searched_at = {}, now
+    uids.sort()
+    
+    # En-têtes des seuls résultats affichés (les plus récents) et pas encore lus
+    missing = [uid for uid in uids[-limit:] if uid not in emails] if limit else [uid for uid in uids if uid not in emails]
+    if missing:
+        fetched = _fetch_uids(mail, missing, folder, since_date, headers_only=True, gmail_attributes=gmail)
+        fetched_by_uid = {int(email_data["uid"]): email_data for email_data in fetched if email_data.get("uid")}
+        for uid in missing:
+            # None : message écarté (hors filtre de date) ou illisible, inutile de le redemander
+            emails[uid] = fetched_by_uid.get(uid)
+    
+    return {
+        'folder': folder,
+        'uidvalidity': uidvalidity,
+        'uidnext': uidnext,
+        'uids': uids,
+        'emails': emails,
+        'searched_at': searched_at,
+        'checked_at': now
+    }
+
+def _store_search(key, entry):
+    """Enregistre une entrée du cache de recherche en bornant sa taille"""
+    with _search_cache_lock:
+        # Réinsérée en dernier : les entrées les plus anciennement rafraîchies sont évincées d'abord
+        _search_cache.pop(key, None)
+        _search_cache[key] = entry
+        while len(_search_cache) > SEARCH_CACHE_MAX_ENTRIES:
+            _search_cache.pop(next(iter(_search_cache)))
+
+def _search_results(entry, limit):
+    """Emails d'une entrée du cache de recherche, du plus récent au plus ancien"""
+    uids = entry['uids'][-limit:] if limit else entry['uids']
+    # Copies : l'appelant peut compléter les emails (corps chargé à l'ouverture) sans modifier le cache
+    emails = [dict(entry['emails'][uid]) for uid in uids if entry['emails'].get(uid)]
+    return sort_emails_by_date(emails)
+
+def search_mailbox(query, category_folder=None, since_date=None, limit=SEARCH_RESULT_LIMIT, credentials=None):
+    """Recherche sur le serveur IMAP (X-GM-RAW sur Gmail, SEARCH TEXT sinon), y compris les messages jamais synchronisés
+    
+    Seuls les en-têtes des `limit` résultats les plus récents sont téléchargés. Les UIDs trouvés sont
+    gardés en cache par (utilisateur, requête, dossier) : réutilisés tels quels pendant SEARCH_CACHE_TTL,
+    puis complétés par une recherche limitée aux UIDs arrivés depuis, et refaits entièrement après
+    SEARCH_CACHE_MAX_AGE ou si UIDVALIDITY change.
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+    if credentials is None:
+        from auth_utils import get_current_user_credentials
+        credentials = get_current_user_credentials()
+    if not credentials:
+        st.error("❌ Impossible de récupérer les identifiants utilisateur")
+        return []
+    
+    key = (credentials["email"], query, category_folder, _since_key(since_date))
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+    if entry and time.monotonic() - entry['checked_at'] < SEARCH_CACHE_TTL:
+        return _search_results(entry, limit)
+    
+    try:
+        entry = _run_imap(
+            lambda mail: _refresh_search(mail, query, category_folder, since_date, limit, entry),
+            credentials
+        )
+    except Exception as e:
+        st.error(f"❌ Erreur lors de la recherche sur le serveur : {str(e)}")
+        return []
+    if entry is None:
+        return []
+    
+    _store_search(key, entry)
+    return _search_results(entry, limit)
+
+def merge_search_results(local_emails, remote_emails):
+    """Fédère les résultats de l'index local (classés par pertinence) et ceux de la recherche serveur
+    
+    Les messages déjà synchronisés gardent leur rang local ; ceux que seul le serveur connaît
+    (récents ou jamais synchronisés) suivent, du plus récent au plus ancien.
+    """
+    local_ids = {email_data.get("email_id") for email_data in local_emails if email_data.get("email_id")}
+    remote_only = [email_data for email_data in remote_emails if email_data.get("email_id") not in local_ids]
+    return list(local_emails) + sort_emails_by_date(remote_only)
+
 def fetch_emails_from_imap(since_date=None):
     """Récupère les emails depuis IMAP (version simplifiée pour compatibilité)"""
     # Pour compatibilité avec l'ancien code, récupère seulement la boîte de réception
     return fetch_emails_from_category("INBOX", since_date, limit=100)
 
+def _select_response_int(mail, name):
+    """Lit une réponse numérique de SELECT (UIDVALIDITY, UIDNEXT...) sans la consommer"""
+    data = mail.untagged_responses.get(name)
+    try:
+        return int(data[-1])
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def _since_key(since_date):
+    """Normalise le filtre de date en chaîne ISO (jour) pour l'état de synchronisation"""
+    if not since_date:
+        return None
+    if isinstance(since_date, datetime):
+        since_date = since_date.date()
+    return since_date.isoformat()
+
+def _expand_uid_set(uid_set):
+    """Développe une séquence IMAP (ex: 41,43:45) en liste d'UIDs"""
+    uids = []
+    for part in uid_set.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if ":" in part:
+            first, last = (int(bound) for bound in part.split(":", 1))
+            uids.extend(range(min(first, last), max(first, last) + 1))
+        else:
+            uids.append(int(part))
+    return uids
+
+def _enabled_condstore(mail):
+    """Extension activée par le pool à la connexion (QRESYNC, CONDSTORE ou "" si aucune)"""
+    return getattr(mail, "enabled_extension", "")
+
+def _fetch_flag_changes(mail, sync_state, highest_modseq, qresync):
+    """Récupère les changements de drapeaux et les UIDs disparus depuis le dernier MODSEQ connu"""
+    changes = {'seen': [], 'unseen': [], 'vanished': []}
+    known_modseq = sync_state.get('highest_modseq')
+    last_uid = sync_state.get('last_uid') or 0
+    if not known_modseq or not last_uid or highest_modseq is None or highest_modseq <= known_modseq:
+        return changes
+    
+    modifier = f"(CHANGEDSINCE {known_modseq} VANISHED)" if qresync else f"(CHANGEDSINCE {known_modseq})"
+    status, data = mail.uid('FETCH', f"1:{last_uid}", "(FLAGS)", modifier)
+    if status != "OK":
+        return changes
+    
+    for record in _parse_fetch_response(data):
+        if not record.get("UID"):
+            continue
+        if "\\Seen" in (record.get("FLAGS") or []):
+            changes['seen'].append(int(record["UID"]))
+        else:
+            changes['unseen'].append(int(record["UID"]))
+    
+    if qresync:
+        typ, vanished = mail.response('VANISHED')
+        for item in vanished or []:
+            if isinstance(item, bytes):
+                item = item.decode('ascii', errors='ignore')
+            if item:
+                changes['vanished'].extend(_expand_uid_set(item.replace("(EARLIER)", "")))
+    
+    return changes
+
+def _fetch_new_since_watermark(mail, category_folder, sync_state, since_date, limit, batch_size):
+    """Récupère les emails au-delà du dernier UID synchronisé, ou resynchronise si UIDVALIDITY a changé"""
+    enabled_extension = _enabled_condstore(mail)
+    
+    if not _select_folder(mail, category_folder):
+        return None
+    
+    uidvalidity = _select_response_int(mail, 'UIDVALIDITY')
+    uidnext = _select_response_int(mail, 'UIDNEXT')
+    highest_modseq = _select_response_int(mail, 'HIGHESTMODSEQ') if enabled_extension else None
+    since_key = _since_key(since_date)
+    flag_changes = {'seen': [], 'unseen': [], 'vanished': []}
+    
+    # Synchronisation incrémentale possible si le dossier n'a pas été renuméroté
+    # et si la période demandée est déjà couverte par les synchronisations précédentes
+    incremental = (
+        sync_state
+        and uidvalidity is not None
+        and sync_state.get('uidvalidity') == uidvalidity
+        and (not sync_state.get('synced_since') or (since_key and since_key >= sync_state['synced_since']))
+    )
+    
+    if incremental:
+        last_uid = sync_state.get('last_uid') or 0
+        synced_since = sync_state.get('synced_since')
+        
+        # Drapeaux modifiés depuis un autre client (uniquement si HIGHESTMODSEQ a bougé)
+        flag_changes = _fetch_flag_changes(mail, sync_state, highest_modseq, enabled_extension == "QRESYNC")
+        
+        # Rien de nouveau depuis la dernière synchronisation : le SELECT suffit
+        if uidnext is not None and uidnext <= last_uid + 1:
+            return [], {
+                'uidvalidity': uidvalidity,
+                'last_uid': last_uid,
+                'synced_since': synced_since,
+                'highest_modseq': highest_modseq,
+                'flag_changes': flag_changes
+            }
+        
+        status, messages = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+        if status != "OK":
+            return None
+        
+        # "UID n:*" renvoie toujours le dernier message, même s'il est sous le seuil
+        new_uids = [uid for uid in messages[0].split() if int(uid) > last_uid]
+    else:
+        last_uid = 0
+        synced_since = since_key
+        
+        new_uids = _search_recent_uids(mail, since_date, limit)
+        if new_uids is None:
+            return None
+    
+    # Au-delà du filigrane, tous les nouveaux UIDs sont téléchargés (par lots) : last_uid passe ensuite
+    # à UIDNEXT - 1, donc un message laissé de côté ici ne serait jamais repris. La limite ne vaut que
+    # pour la première synchronisation, déjà appliquée par _search_recent_uids.
+    failed_uids = []
+    emails = _fetch_uids(mail, new_uids, category_folder, since_date, batch_size, failed_uids=failed_uids)
+    
+    if failed_uids:
+        # Lot ou message en échec : le filigrane s'arrête juste avant, la suite est reprise au prochain passage
+        new_last_uid = max(last_uid, min(int(uid) for uid in failed_uids) - 1)
+    elif uidnext is not None:
+        new_last_uid = max(last_uid, uidnext - 1)
+    else:
+        new_last_uid = max([last_uid] + [int(uid) for uid in new_uids])
+    
+    return emails, {
+        'uidvalidity': uidvalidity,
+        'last_uid': new_last_uid,
+        'synced_since': synced_since,
+        'highest_modseq': highest_modseq,
+        'flag_changes': flag_changes
+    }
+
+def _fetch_folder_changes(user_id, category, category_folder, since_date, limit, batch_size, credentials):
+    """Phase IMAP d'une synchronisation incrémentale : (état connu, nouveaux emails, nouvel état du dossier) ou None"""
+    from database_utils import get_mail_sync_state
+    
+    sync_state = get_mail_sync_state(user_id, category_folder)
+    result = _run_imap(
+        lambda mail: _fetch_new_since_watermark(mail, category_folder, sync_state, since_date, limit, batch_size),
+        credentials
+    )
+    if result is None:
+        return None
+    
+    emails, folder_state = result
+    for email_data in emails:
+        email_data['category'] = category
+    return sync_state, emails, folder_state
+
+def _save_folder_changes(user_id, category_folder, sync_state, emails, folder_state, synced_ids):
+    """Phase base de données : drapeaux modifiés et état de synchronisation du dossier"""
+    from database_utils import save_mail_sync_state, apply_imap_flag_changes
+    
+    if any(email_data['email_id'] not in synced_ids for email_data in emails):
+        # Ne pas avancer le curseur : les emails manquants seront repris au prochain passage
+        return
+    
+    flag_changes = folder_state['flag_changes']
+    if any(flag_changes.values()):
+        applied = apply_imap_flag_changes(
+            user_id,
+            category_folder,
+            folder_state['uidvalidity'],
+            seen_uids=flag_changes['seen'],
+            unseen_uids=flag_changes['unseen'],
+            vanished_uids=flag_changes['vanished']
+        )
+        if applied is None:
+            # Garder l'ancien MODSEQ pour redemander ces changements au prochain passage
+            folder_state['highest_modseq'] = sync_state.get('highest_modseq') if sync_state else None
+    
+    if folder_state['uidvalidity'] is not None:
+        save_mail_sync_state(
+            user_id,
+            category_folder,
+            folder_state['uidvalidity'],
+            folder_state['last_uid'],
+            folder_state['synced_since'],
+            folder_state['highest_modseq']
+        )
+
+def _sync_fetched_emails(user_id, emails):
+    """Enregistre en un seul appel les emails téléchargés ; renvoie les email_id enregistrés"""
+    from database_utils import sync_emails_with_imap
+    
+    if not emails:
+        return set()
+    synced = sync_emails_with_imap(user_id, emails)
+    return set(synced['ids']) if synced else set()
+
+def sync_folder_incremental(user_id, category, category_folder, since_date=None, limit=50, batch_size=IMAP_FETCH_BATCH_SIZE, credentials=None):
+    """Synchronise un dossier avec la base en ne téléchargeant que les nouveaux UIDs"""
+    try:
+        fetched = _fetch_folder_changes(user_id, category, category_folder, since_date, limit, batch_size, credentials)
+        if fetched is None:
+            return []
+        
+        sync_state, emails, folder_state = fetched
+        _save_folder_changes(user_id, category_folder, sync_state, emails, folder_state, _sync_fetched_emails(user_id, emails))
+        return emails
+        
+    except Exception as e:
+        st.error(f"❌ Erreur de synchronisation pour catégorie '{category_folder}': {str(e)}")
+        return []
+
+def sync_folders_incremental(user_id, categories, since_date=None, limit=50, batch_size=IMAP_FETCH_BATCH_SIZE, credentials=None):
+    """Synchronise plusieurs dossiers ({nom: dossier}) : téléchargements IMAP en parallèle, puis une seule écriture
+    
+    Un même message présent dans la boîte de réception et dans un onglet n'est ainsi enregistré qu'une
+    fois (sync_emails_with_imap garde l'onglet), au lieu de deux upserts concurrents.
+    """
+    def fetch_folder(category, category_folder):
+        try:
+            return _fetch_folder_changes(user_id, category, category_folder, since_date, limit, batch_size, credentials)
+        except Exception as e:
+            st.error(f"❌ Erreur de synchronisation pour catégorie '{category_folder}': {str(e)}")
+            return None
+    
+    fetched = _map_categories_in_parallel(fetch_folder, categories)
+    
+    try:
+        synced_ids = _sync_fetched_emails(user_id, [
+            email_data for result in fetched.values() if result for email_data in result[1]
+        ])
+        for category, result in fetched.items():
+            if result:
+                sync_state, emails, folder_state = result
+                _save_folder_changes(user_id, categories[category], sync_state, emails, folder_state, synced_ids)
+    except Exception as e:
+        st.error(f"❌ Erreur de synchronisation : {str(e)}")
+    
+    return {category: result[1] if result else [] for category, result in fetched.items()}
+
 def initialize_mails(force_sync=False, since_date=None, selected_categories=None):
     """Initialise les emails par catégorie"""
     try:
-        from database_utils import sync_emails_with_imap, get_user_emails_by_category
+        from database_utils import get_user_emails_by_category
+        from auth_utils import get_current_user_credentials
         
         user_id = st.session_state.get('user_id')
         if not user_id:
@@ -235,22 +1461,23 @@ def initialize_mails(force_sync=False, since_date=None, selected_categories=None
         all_emails = {}
         
         if force_sync:
-            # Forcer la synchronisation depuis Gmail
-            st.info("🔄 Synchronisation complète avec Gmail...")
+            # Synchroniser avec Gmail (seuls les nouveaux UIDs sont téléchargés)
+            st.info("🔄 Synchronisation avec Gmail...")
             
-            for category in selected_categories:
-                folder_name = get_gmail_categories()[category]
-                emails = fetch_emails_from_category(folder_name, since_date, limit=50)
-                
-                if emails:
-                    # Ajouter la catégorie à chaque email
-                    for email in emails:
-                        email['category'] = category
-                    
-                    # Synchroniser avec la base de données
-                    synced_count = sync_emails_with_imap(user_id, emails)
-                    
-                all_emails[category] = emails
+            credentials = get_current_user_credentials()
+            gmail_categories = get_gmail_categories()
+            all_emails = sync_folders_incremental(
+                user_id,
+                {category: gmail_categories[category] for category in selected_categories},
+                since_date,
+                limit=50,
+                credentials=credentials
+            )
+            
+            # Les emails déjà synchronisés sont en base : renvoyer la vue complète
+            synced_emails = get_user_emails_by_category(user_id, since_date, selected_categories)
+            if synced_emails:
+                all_emails = synced_emails
         else:
             # Charger depuis la base de données d'abord
             try:
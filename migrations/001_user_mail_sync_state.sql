@@ -0,0 +1,13 @@
+-- État de synchronisation IMAP par utilisateur et par dossier
+-- (curseur UIDVALIDITY / dernier UID vu pour la synchronisation incrémentale)
+create table if not exists user_mail_sync_state (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid not null references users(id) on delete cascade,
+    folder text not null,
+    uidvalidity bigint not null,
+    last_uid bigint not null default 0,
+    synced_since date,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now(),
+    unique (user_id, folder)
+);
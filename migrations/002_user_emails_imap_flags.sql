@@ -0,0 +1,11 @@
+-- Emplacement IMAP de chaque email, pour répercuter en masse les drapeaux
+-- (\Seen) et les messages disparus remontés par CONDSTORE/QRESYNC
+alter table user_emails add column if not exists imap_folder text;
+alter table user_emails add column if not exists imap_uid bigint;
+alter table user_emails add column if not exists imap_uidvalidity bigint;
+
+create index if not exists user_emails_imap_location_idx
+    on user_emails (user_id, imap_folder, imap_uidvalidity, imap_uid);
+
+-- Dernier MODSEQ connu par dossier (CONDSTORE)
+alter table user_mail_sync_state add column if not exists highest_modseq bigint;
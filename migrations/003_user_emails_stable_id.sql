@@ -0,0 +1,4 @@
+-- Identifiant stable et compact par email (gm:<X-GM-MSGID>, mid:<hash Message-ID>
+-- ou uid:<hash dossier/UIDVALIDITY/UID>), unique par utilisateur
+create unique index if not exists user_emails_user_email_id_key
+    on user_emails (user_id, email_id);
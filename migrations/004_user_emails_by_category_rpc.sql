@@ -0,0 +1,27 @@
+-- N emails les plus récents par catégorie, limités côté serveur (fenêtre row_number)
+-- au lieu de renvoyer toutes les lignes de l'utilisateur
+create index if not exists user_emails_user_category_date_idx
+    on user_emails (user_id, category, date_received desc);
+
+create or replace function get_user_emails_by_category(
+    p_user_id uuid,
+    p_since timestamptz default null,
+    p_categories text[] default null,
+    p_limit_per_category integer default 50
+)
+returns setof user_emails
+language sql
+stable
+as $$
+    select (ranked.email).*
+    from (
+        select e as email,
+               row_number() over (partition by e.category order by e.date_received desc) as category_rank
+        from user_emails e
+        where e.user_id = p_user_id
+          and (p_since is null or e.date_received >= p_since)
+          and (p_categories is null or e.category = any(p_categories))
+    ) ranked
+    where ranked.category_rank <= p_limit_per_category
+    order by (ranked.email).date_received desc;
+$$;
@@ -0,0 +1,44 @@
+-- Aperçu stocké : les listes ne transfèrent plus le corps complet des emails
+alter table user_emails add column if not exists snippet text;
+
+update user_emails
+set snippet = left(regexp_replace(coalesce(body, ''), '\s+', ' ', 'g'), 150)
+where snippet is null;
+
+-- Même fonction que 004, limitée aux colonnes affichées dans les listes
+drop function if exists get_user_emails_by_category(uuid, timestamptz, text[], integer);
+
+create function get_user_emails_by_category(
+    p_user_id uuid,
+    p_since timestamptz default null,
+    p_categories text[] default null,
+    p_limit_per_category integer default 50
+)
+returns table (
+    id user_emails.id%type,
+    email_id text,
+    sender text,
+    recipient text,
+    subject text,
+    date_received timestamptz,
+    category text,
+    is_processed boolean,
+    snippet text
+)
+language sql
+stable
+as $$
+    select ranked.id, ranked.email_id, ranked.sender, ranked.recipient, ranked.subject,
+           ranked.date_received, ranked.category, ranked.is_processed, ranked.snippet
+    from (
+        select e.id, e.email_id, e.sender, e.recipient, e.subject,
+               e.date_received, e.category, e.is_processed, e.snippet,
+               row_number() over (partition by e.category order by e.date_received desc) as category_rank
+        from user_emails e
+        where e.user_id = p_user_id
+          and (p_since is null or e.date_received >= p_since)
+          and (p_categories is null or e.category = any(p_categories))
+    ) ranked
+    where ranked.category_rank <= p_limit_per_category
+    order by ranked.date_received desc;
+$$;
@@ -0,0 +1,7 @@
+-- Pagination par curseur (date_received, id) : chaque page est une lecture d'index
+-- de taille constante, quelle que soit la profondeur
+create index if not exists user_emails_user_category_date_id_idx
+    on user_emails (user_id, category, date_received desc, id desc);
+
+create index if not exists user_emails_user_date_id_idx
+    on user_emails (user_id, date_received desc, id desc);
@@ -0,0 +1,26 @@
+-- Statistiques de la barre latérale en un seul aller-retour : totaux et non traités
+-- par catégorie (GROUP BY), résumés générés et réponses envoyées
+create or replace function get_user_mailbox_statistics(p_user_id uuid)
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'categories', coalesce((
+            select jsonb_object_agg(
+                counts.category,
+                jsonb_build_object('total', counts.total, 'unprocessed', counts.unprocessed)
+            )
+            from (
+                select coalesce(e.category, 'Boîte de réception') as category,
+                       count(*) as total,
+                       count(*) filter (where not coalesce(e.is_processed, false)) as unprocessed
+                from user_emails e
+                where e.user_id = p_user_id
+                group by 1
+            ) counts
+        ), '{}'::jsonb),
+        'summaries_generated', (select count(*) from email_summaries s where s.user_id = p_user_id),
+        'replies_sent', (select count(*) from email_replies r where r.user_id = p_user_id and r.was_sent)
+    );
+$$;
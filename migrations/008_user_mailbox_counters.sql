@@ -0,0 +1,91 @@
+-- Compteurs par utilisateur et par catégorie, tenus à jour par les écritures
+-- (database_utils) : la barre latérale lit quelques lignes par clé primaire
+create table if not exists user_mailbox_counters (
+    user_id uuid not null references users(id) on delete cascade,
+    category text not null,
+    total bigint not null default 0,
+    unprocessed bigint not null default 0,
+    summarized bigint not null default 0,
+    replied bigint not null default 0,
+    updated_at timestamptz not null default now(),
+    primary key (user_id, category)
+);
+
+-- Incrément atomique ; la catégorie peut être déduite de l'email (user_emails.id)
+create or replace function increment_mailbox_counters(
+    p_user_id uuid,
+    p_category text default null,
+    p_email_id user_emails.id%type default null,
+    p_total integer default 0,
+    p_unprocessed integer default 0,
+    p_summarized integer default 0,
+    p_replied integer default 0
+)
+returns void
+language plpgsql
+as $$
+declare
+    v_category text := p_category;
+begin
+    if v_category is null and p_email_id is not null then
+        select e.category into v_category
+        from user_emails e
+        where e.id = p_email_id and e.user_id = p_user_id;
+    end if;
+    if v_category is null then
+        return;
+    end if;
+
+    insert into user_mailbox_counters as c (user_id, category, total, unprocessed, summarized, replied)
+    values (p_user_id, v_category, greatest(p_total, 0), greatest(p_unprocessed, 0),
+            greatest(p_summarized, 0), greatest(p_replied, 0))
+    on conflict (user_id, category) do update
+    set total = greatest(c.total + p_total, 0),
+        unprocessed = greatest(c.unprocessed + p_unprocessed, 0),
+        summarized = greatest(c.summarized + p_summarized, 0),
+        replied = greatest(c.replied + p_replied, 0),
+        updated_at = now();
+end;
+$$;
+
+-- Recalcul complet depuis les tables sources (un utilisateur, ou tous si p_user_id est nul)
+-- pour corriger toute dérive des incréments
+create or replace function reconcile_mailbox_counters(p_user_id uuid default null)
+returns setof user_mailbox_counters
+language plpgsql
+as $$
+begin
+    delete from user_mailbox_counters c
+    where p_user_id is null or c.user_id = p_user_id;
+
+    insert into user_mailbox_counters (user_id, category, total, unprocessed, summarized, replied)
+    select e.user_id,
+           coalesce(e.category, 'Boîte de réception'),
+           count(*),
+           count(*) filter (where not coalesce(e.is_processed, false)),
+           coalesce(sum(s.summaries), 0),
+           coalesce(sum(r.replies), 0)
+    from user_emails e
+    left join (
+        select email_id, count(*) as summaries from email_summaries group by email_id
+    ) s on s.email_id = e.id
+    left join (
+        select email_id, count(*) as replies from email_replies where was_sent group by email_id
+    ) r on r.email_id = e.id
+    where p_user_id is null or e.user_id = p_user_id
+    group by 1, 2;
+
+    return query
+    select * from user_mailbox_counters c
+    where p_user_id is null or c.user_id = p_user_id;
+end;
+$$;
+
+-- Réconciliation nocturne si pg_cron est disponible
+do $$
+begin
+    if exists (select 1 from pg_extension where extname = 'pg_cron') then
+        perform cron.schedule('reconcile-mailbox-counters', '15 3 * * *', 'select reconcile_mailbox_counters()');
+    end if;
+end;
+$$;
@@ -0,0 +1,10 @@
+-- Rattrapage du miroir local par curseur (updated_at, id) : updated_at toujours renseigné
+update user_emails
+set updated_at = coalesce(created_at, now())
+where updated_at is null;
+
+alter table user_emails alter column updated_at set default now();
+alter table user_emails alter column updated_at set not null;
+
+create index if not exists user_emails_user_updated_id_idx
+    on user_emails (user_id, updated_at, id);
@@ -0,0 +1,62 @@
+-- Recherche plein texte : index inversé (tsvector + GIN) sur sujet, expéditeur et corps
+alter table user_emails add column if not exists search_vector tsvector
+    generated always as (
+        setweight(to_tsvector('french', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('french', coalesce(sender, '')), 'B') ||
+        setweight(to_tsvector('french', coalesce(body, '')), 'C')
+    ) stored;
+
+create index if not exists user_emails_search_vector_idx
+    on user_emails using gin (search_vector);
+
+-- Résultats classés (ts_rank_cd) avec extrait surligné (ts_headline, calculé sur les seuls résultats).
+-- Les termes trouvés sont encadrés par les caractères de contrôle \x02 et \x03.
+create or replace function search_user_emails(
+    p_user_id uuid,
+    p_query text,
+    p_category text default null,
+    p_since timestamptz default null,
+    p_limit integer default 50
+)
+returns table (
+    id user_emails.id%type,
+    email_id text,
+    sender text,
+    recipient text,
+    subject text,
+    date_received timestamptz,
+    category text,
+    is_processed boolean,
+    snippet text,
+    rank real,
+    highlight text
+)
+language sql
+stable
+as $$
+    with query as (
+        select websearch_to_tsquery('french', p_query) as q
+    ),
+    hits as (
+        select e.id, e.email_id, e.sender, e.recipient, e.subject, e.date_received,
+               e.category, e.is_processed, e.snippet, e.body,
+               ts_rank_cd(e.search_vector, query.q) as rank
+        from user_emails e, query
+        where e.user_id = p_user_id
+          and e.search_vector @@ query.q
+          and (p_category is null or e.category = p_category)
+          and (p_since is null or e.date_received >= p_since)
+        order by rank desc, e.date_received desc
+        limit p_limit
+    )
+    select hits.id, hits.email_id, hits.sender, hits.recipient, hits.subject, hits.date_received,
+           hits.category, hits.is_processed, hits.snippet, hits.rank,
+           ts_headline(
+               'french',
+               coalesce(nullif(hits.body, ''), hits.subject, ''),
+               query.q,
+               'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=30, MinWords=12, MaxFragments=2'
+           ) as highlight
+    from hits, query
+    order by hits.rank desc, hits.date_received desc;
+$$;
@@ -0,0 +1,44 @@
+-- Doublons laissés par le passage aux identifiants stables (003) : un même message stocké sous un
+-- ancien identifiant (chaîne composite ou MD5 du contenu) et sous gm:/mid:/uid:.
+-- L'ancienne ligne est fusionnée dans la nouvelle (état lu, résumés, réponses) puis supprimée.
+-- Les lignes anciennes sans doublon sont renommées à la synchronisation suivante (database_utils).
+create temporary table legacy_email_duplicates as
+select distinct on (legacy.id)
+       legacy.id as legacy_id,
+       stable.id as stable_id,
+       legacy.is_processed as legacy_processed
+from user_emails legacy
+join user_emails stable
+  on stable.user_id = legacy.user_id
+ and stable.sender is not distinct from legacy.sender
+ and stable.subject is not distinct from legacy.subject
+ and stable.date_received = legacy.date_received
+where legacy.email_id !~ '^(gm|mid|uid):'
+  and stable.email_id ~ '^(gm|mid|uid):'
+order by legacy.id, stable.id;
+
+update user_emails e
+set is_processed = true
+from legacy_email_duplicates d
+where e.id = d.stable_id
+  and d.legacy_processed
+  and not e.is_processed;
+
+update email_summaries s
+set email_id = d.stable_id
+from legacy_email_duplicates d
+where s.email_id::text = d.legacy_id::text;
+
+update email_replies r
+set email_id = d.stable_id
+from legacy_email_duplicates d
+where r.email_id::text = d.legacy_id::text;
+
+delete from user_emails e
+using legacy_email_duplicates d
+where e.id = d.legacy_id;
+
+drop table legacy_email_duplicates;
+
+-- Compteurs de la barre latérale (008) recalculés après la suppression des doublons
+select count(*) from reconcile_mailbox_counters();
@@ -0,0 +1,17 @@
+-- updated_at posé par la base à chaque écriture sur user_emails : le curseur de rattrapage
+-- du miroir local (updated_at, id) ne dépend plus des horloges des clients
+create or replace function set_user_emails_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists user_emails_set_updated_at on user_emails;
+create trigger user_emails_set_updated_at
+    before insert or update on user_emails
+    for each row
+    execute function set_user_emails_updated_at();
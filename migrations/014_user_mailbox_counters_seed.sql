@@ -0,0 +1,5 @@
+-- Compteurs de la barre latérale (008) initialisés pour tous les utilisateurs existants :
+-- sans cela, un incrément reçu avant la première lecture créait une ligne partielle
+-- (partant de zéro) ensuite considérée comme exacte. Les nouveaux utilisateurs partent
+-- bien de zéro, leurs incréments suffisent.
+select count(*) from reconcile_mailbox_counters();